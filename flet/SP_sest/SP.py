@@ -3,11 +3,9 @@ import subprocess
 import ctypes
 import sys
 import flet as ft
-import requests
-from requests_negotiate_sspi import HttpNegotiateAuth
-import urllib3
 from urllib.parse import quote
 import os
+import shutil
 from pathlib import Path
 from datetime import datetime
 import threading
@@ -15,9 +13,9 @@ import time
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple, List, Dict, TypedDict, Optional
-
-# SSL証明書の警告を無視
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# SharePointクライアントは streamlit/Routine/scripts の1ファイルを共用する
+sys.path.append(str(Path(__file__).resolve().parents[2] / 'streamlit' / 'Routine' / 'scripts'))
+from sharepoint import get_client
 
 _dsp_info_cache: Optional[Dict[str, str]] = None
 _dsp_info_lock = threading.Lock()
@@ -35,11 +33,6 @@ class FileInfo(TypedDict):
     server_relative_url: str
     guid: str
 
-# グローバルセッションの作成
-global_session = requests.Session()
-setattr(global_session, 'auth', HttpNegotiateAuth())
-setattr(global_session, 'verify', False)
-
 def read_dsp_info() -> Tuple[Dict[str, str], List[Dict[str, str]]]:
     """DSP情報をSharePointから直接読み込む（非同期対応版）"""
     global _dsp_info_cache
@@ -50,7 +43,7 @@ def read_dsp_info() -> Tuple[Dict[str, str], List[Dict[str, str]]]:
 
     try:
         url = "https://share.amazon.com/sites/COJP_ORM/Shared%20Documents/04_Metrics/dsp_info.txt"
-        response = global_session.get(url, timeout=30)
+        response = get_client().get(url)
         
         if response.status_code == 200:
             import csv
@@ -114,17 +107,7 @@ def get_files_and_guids() -> Tuple[List[FileInfo], Dict[str, str]]:
     guid_map: Dict[str, str] = {}
 
     try:
-        headers = {
-            'Accept': 'application/json;odata=verbose',
-            'Content-Type': 'application/json;odata=verbose',
-            'User-Agent': 'Python NTLM Client'
-        }
-        
-        response = global_session.get(
-            FOLDER_URL,
-            headers=headers,
-            timeout=30
-        )
+        response = get_client().get(FOLDER_URL)
         
         response.raise_for_status()
         data = response.json()
@@ -156,30 +139,20 @@ def download_file(file_info: FileInfo) -> str:
     try:
         file_url = f"{BASE_URL}{file_info['server_relative_url']}"
 
-        response = global_session.get(
-            file_url,
-            timeout=30,
-            stream=True
-        )
+        # 条件付きGET：304ならローカルキャッシュのコピーを使う
+        cached_path = get_client().download_cached(file_url, key=file_info['server_relative_url'])
         
-        if response.status_code == 200:
-            downloads_path = str(Path.home() / "Downloads")
-            file_path = os.path.join(downloads_path, file_info['name'])
-            
-            base, ext = os.path.splitext(file_path)
-            counter = 1
-            while os.path.exists(file_path):
-                file_path = f"{base}_{counter}{ext}"
-                counter += 1
-            
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-            
-            return file_path
+        downloads_path = str(Path.home() / "Downloads")
+        file_path = os.path.join(downloads_path, file_info['name'])
         
-        return ""
+        base, ext = os.path.splitext(file_path)
+        counter = 1
+        while os.path.exists(file_path):
+            file_path = f"{base}_{counter}{ext}"
+            counter += 1
+        
+        shutil.copyfile(cached_path, file_path)
+        return file_path
             
     except Exception as e:
         print(f"ダウンロードエラー: {str(e)}")
@@ -1,9 +1,14 @@
+import sys
 import flet as ft
 import pandas as pd
 from pathlib import Path
 import webbrowser
+import shutil
 from datetime import datetime
 from auth import sp
+# station索引は streamlit/Routine/scripts の1ファイルを共用する
+sys.path.append(str(Path(__file__).resolve().parents[2] / 'streamlit' / 'Routine' / 'scripts'))
+from station_index import get_station_index
 
 
 TODAY = datetime.now().strftime('%Y/%m/%d')
@@ -36,13 +41,11 @@ def open_cortex_roster_sui(e, ds: str, view_type: str):
         raise ValueError(f"Invalid view_type: {view_type}")
     
     try:
-        df = pd.read_csv(info_path).drop_duplicates(subset='station_code')
-        ds = ds.upper()
-        
-        if ds not in df['station_code'].values:
+        stations = get_station_index(info_path)
+        if ds not in stations:
             raise ValueError(f'Invalid station code: {ds}')
         
-        service_area_id = df[df['station_code'] == ds]['service_area_id'].iloc[0]
+        service_area_id = stations.lookup(ds)
         url = LOGISTICS_BASE_URL + view_paths[view_type].format(service_area_id)
         webbrowser.open(url)
     except Exception as e:
@@ -78,7 +81,8 @@ def get_files_and_guids():
 def download_file(file_info):
     try:
         file_url = f"{BASE_URL}{file_info['server_relative_url']}"
-        response = sp.get(file_url)
+        # 条件付きGET：304ならローカルキャッシュのコピーを使う
+        cached_path = sp.client.download_cached(file_url, key=file_info['server_relative_url'])
         
         download_path = Path.home() / "Downloads"
         file_path = download_path / file_info['name']
@@ -90,10 +94,7 @@ def download_file(file_info):
             file_path = file_path.with_name(f"{base}_{counter}{ext}")
             counter += 1
             
-        with file_path.open('wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        shutil.copyfile(cached_path, file_path)
         return file_path
     except Exception as e:
         print(f"ダウンロードエラー： {str(e)}")
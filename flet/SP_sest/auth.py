@@ -1,7 +1,6 @@
+import sys
 from pathlib import Path
 import requests
-from requests_negotiate_sspi import HttpNegotiateAuth
-from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import io
 from datetime import datetime
@@ -15,9 +14,11 @@ from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
+# SharePointクライアントは streamlit/Routine/scripts の1ファイルを共用する
+sys.path.append(str(Path(__file__).resolve().parents[2] / 'streamlit' / 'Routine' / 'scripts'))
+from sharepoint import get_client, SHAREPOINT_BASE_URL
 
 LOGISTICS_BASE_URL = "https://logistics.amazon.co.jp/internal"
-SHAREPOINT_BASE_URL = "https://share.amazon.com"
 SHAREPOINT_TEAM_URL = "sites/COJP_ORM"
 DOWNLOAD_PATH = Path.home() / 'Documents/dsp_info/data'
 TODAY = datetime.now().strftime('%Y/%m/%d')
@@ -26,20 +27,17 @@ MIDWAY_FILE = f"C:\\Users\\{USERNAME}\\AppData\\Local\\Google\\Chrome\\python\\M
 
 class Sharepoint:
     def __init__(self):    
-        self.session = requests.Session()
-        self.session.auth = HttpNegotiateAuth()
-        self.session.verify = False
-        self.headers = {
-            'Accept': 'application/json;odata=verbose',
-            'Content-Type': 'application/json;odata=verbose'
-        }
+        # セッション・認証・リトライは共通クライアントに任せる
+        self.client = get_client()
+        self.session = self.client.session
+        
+    def get(self, url: str, **kwargs):
+        return self.client.get(url, **kwargs)
         
     def get_files(self, path: str, output_dir: str, max_workers: int = 5):
         folder_url = f"{SHAREPOINT_BASE_URL}/{SHAREPOINT_TEAM_URL}/_api/web/GetFolderByServerRelativeUrl('{path}')/Files"
         try:
-            response = self.session.get(folder_url, headers=self.headers, verify=self.session.verify)
-            response.raise_for_status()
-            files = response.json().get('d', {}).get('results', [])
+            files = self.client.get_json(folder_url)
 
             def download_file(file):
                 file_name = file.get('Name') or file.get('name')
@@ -48,10 +46,7 @@ class Sharepoint:
                 output_path.parent.mkdir(parents=True, exist_ok=True)
 
                 try:
-                    file_response = self.session.get(file_url, headers=self.headers, verify=self.session.verify)
-                    file_response.raise_for_status()
-                    with open(output_path, 'wb') as f:
-                        f.write(file_response.content)
+                    self.client.download(file_url, output_path)
                     return f"Downloaded: {file_name}"
                 except Exception as e:
                     return f"Error downloading {file_name}: {e}"
@@ -67,13 +62,7 @@ class Sharepoint:
     def get_file(self, path: str, output_dir: str, file_name: str):
         folder_url = f"{SHAREPOINT_BASE_URL}/{SHAREPOINT_TEAM_URL}/_api/web/GetFileByServerRelativeUrl('{path}/{file_name}')/$value"
         try:
-            response = self.session.get(folder_url, headers=self.headers, verify=self.session.verify)
-            response.raise_for_status()
-            output_path = Path(output_dir) / file_name
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
+            self.client.download(folder_url, Path(output_dir) / file_name)
             return f"Downloaded: {file_name}"
                 
         except requests.HTTPError as e:
@@ -96,10 +85,7 @@ class Sharepoint:
     
     def get_json(self, path: str):
         try:
-            response = self.session.get(path, headers=self.headers, verify=self.session.verify)
-            response.raise_for_status()
-            data = response.json()
-            return data.get('d', {}).get('results', [])
+            return self.client.get_json(path)
         except Exception as e:
             print(f"Error accessing folder: {e}")
             return None
@@ -107,7 +93,7 @@ class Sharepoint:
     def info_download(self):
         try:
             url = f"{SHAREPOINT_BASE_URL}/{SHAREPOINT_TEAM_URL}/Shared%20Documents/04_Metrics/dsp_info.txt"
-            response = self.session.get(url, headers=self.headers, verify=self.session.verify)
+            response = self.client.get(url)
             
             if response.status_code == 200:
                 df = pd.read_csv(
@@ -194,3 +180,5 @@ class Midway:
         except Exception as e:
             print(f"認証処理でエラーが発生しました: {str(e)}")
             return False
+
+sp = Sharepoint()
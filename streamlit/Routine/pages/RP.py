@@ -1,17 +1,18 @@
 import os
 import pandas as pd
 import streamlit as st
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from datetime import datetime
 import shutil
-import json
-import concurrent.futures
-import time
+from scripts.webdriver_pool import create_driver, get_driver_pool
+from scripts.cortex_summary import parse_summaries, format_summary_table
+from scripts.cortex import get_cortex_client, reset_cortex_client, MidwayAuthError
+from scripts.station_fetch import get_station_fetcher
+from scripts.station_cache import CORTEX_TTL_SECONDS, format_ages, get_station_cache
+from scripts.station_index import get_station_index
+from scripts.cortex_delta import DELTA_COLUMNS, delta_styles, diff_snapshots
 
 def check_midway_auth():
     profile_path = f"C:\\Users\\{os.getenv('USERNAME')}\\AppData\\Local\\Google\\Chrome\\python"
@@ -29,21 +30,7 @@ def update_midway_auth():
         f.write(datetime.now().strftime('%Y/%m/%d'))
 
 def get_service_area_id(station_code: str) -> str:
-    df = pd.read_csv("C:\\Users\\tangtao\\Desktop\\TAO\\Routine\\data\\dsp_info.csv")
-    return str(df[df['station_code'] == station_code]['service_area_id'].iloc[0])
-
-def initialize_driver(headless=False):
-    profile_path = f"C:\\Users\\{os.getenv('USERNAME')}\\AppData\\Local\\Google\\Chrome\\python"
-    
-    options = webdriver.ChromeOptions()
-    options.add_argument(f'--user-data-dir={profile_path}')
-    options.add_argument('--disable-gpu')
-    if headless:
-        options.add_argument('--headless=new')
-    options.add_experimental_option('excludeSwitches', ['enable-logging'])
-    
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-    return driver
+    return get_station_index("C:\\Users\\tangtao\\Desktop\\TAO\\Routine\\data\\dsp_info.csv").lookup(station_code)
 
 def perform_midway_auth(driver):
     username = os.getenv('USERNAME')
@@ -74,110 +61,84 @@ def perform_midway_auth(driver):
     update_midway_auth()
     return True
 
-def get_delivery_info(driver, station_code):
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            service_area_id = get_service_area_id(station_code)
-            date_str = datetime.now().strftime('%Y-%m-%d')
-            
-            api_url = f"https://logistics.amazon.co.jp/internal/operations/execution/api/summaries?historicalDay=false&localDate={date_str}&serviceAreaId={service_area_id}"
-            driver.get(api_url)
-            
-            wait = WebDriverWait(driver, 20)
-            wait.until(EC.presence_of_element_located((By.TAG_NAME, "pre")))
-            
-            json_text = driver.find_element(By.TAG_NAME, "pre").text
-            if not json_text:
-                if attempt < max_retries - 1:
-                    time.sleep(2)
-                    continue
-                return pd.DataFrame()
-            
-            data = json.loads(json_text)
-            delivery_data = []
-            
-            for itinerary in data.get('itinerarySummaries', []):
-                try:
-                    # Flex配送員のみを抽出
-                    company_id = itinerary.get('companyId')
-                    company_info = next((c for c in data.get('companies', []) if c.get('companyId') == company_id), {})
-                    if company_info.get('companyName') != 'Amazon Flex':
-                        continue
-                    
-                    transporter_id = itinerary.get('transporterId')
-                    transporter_info = next((t for t in data.get('transporters', []) if t.get('transporterId') == transporter_id), {})
-                    
-                    route_codes = itinerary.get('routeCodes', [])
-                    route_str = ' '.join(str(code) for code in route_codes) if route_codes else ''
-                    
-                    progress_status = itinerary.get('progressStatus', '')
-                    risk_status = {'BEHIND': '赤', 'AT_RISK': '黄'}.get(progress_status, '青')
-                    
-                    route_delivery_progress = itinerary.get('routes', [{}])[0].get('routeDeliveryProgress', {})
-                    total_deliveries = route_delivery_progress.get('totalDeliveries', 0)
-                    completed_deliveries = route_delivery_progress.get('completedDeliveries', 0)
-                    
-                    delivery_data.append({
-                        "名前": f"{transporter_info.get('firstName', '')} {transporter_info.get('lastName', '')}".strip(),
-                        "ルート": route_str,
-                        "TransporterID": transporter_id,
-                        "電話": transporter_info.get('workPhoneNumber', ''),  # フォーマット処理を削除
-                        "リスク": risk_status,
-                        "全配達": total_deliveries,
-                        "完了配達": completed_deliveries,
-                        "状態": "ログアウト" if itinerary.get('sessionEndTime') else ""
-                    })
-                    
-                except Exception as e:
-                    continue
-            
-            if delivery_data:
-                df = pd.DataFrame(delivery_data)
-                numeric_columns = ['全配達', '完了配達']
-                df[numeric_columns] = df[numeric_columns].astype(int)
-                return df
-            
-            if attempt < max_retries - 1:
-                time.sleep(2)
-                continue
-                
-        except Exception as e:
-            if attempt < max_retries - 1:
-                time.sleep(2)
-                continue
-            else:
-                st.error(f"Station {station_code}: エラー発生 - {str(e)}")
-    
-    return pd.DataFrame()
+def get_delivery_info(cortex, station_code):
+    """Flex配送員のみを抽出（再試行は StationFetcher が行う）"""
+    data = cortex.get_summaries(get_service_area_id(station_code))
+    return parse_summaries(data, company_name='Amazon Flex')
 
-def process_station(station_code):
+def process_station(cortex, station_code):
     """1つのステーションのデータを処理"""
-    max_retries = 2
-    for attempt in range(max_retries):
-        driver = None
+    df = get_delivery_info(cortex, station_code)
+    if not df.empty:
+        df['Station'] = station_code
+    return df
+
+def poll_stations(stations):
+    """全ステーションを取得し直して1つの表と {失敗したステーション: エラー} を返す（キャッシュは使わない）"""
+    cortex = get_cortex_client(get_driver_pool().driver)
+    frames = []
+    errors = {}
+    for station, df, error in get_station_fetcher().run(
+        stations,
+        lambda station: process_station(cortex, station),
+        auth_errors=(MidwayAuthError,)
+    ):
+        if error is not None:
+            errors[station] = error
+        elif not df.empty:
+            frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=DELTA_COLUMNS), errors
+    return format_summary_table(pd.concat(frames, ignore_index=True)), errors
+
+def show_live_monitor(stations, interval):
+    """interval 秒毎にこの部分だけを再実行し、前回からの変化した行だけを表示"""
+    @st.fragment(run_every=interval)
+    def monitor():
         try:
-            driver = initialize_driver(headless=True)
-            df = get_delivery_info(driver, station_code)
-            if not df.empty:
-                df['Station'] = station_code
-                return df
-            if attempt < max_retries - 1:
-                time.sleep(2)
-                continue
-        except Exception as e:
-            if attempt < max_retries - 1:
-                time.sleep(2)
-                continue
-            st.error(f"Station {station_code} の処理中にエラー: {str(e)}")
-        finally:
-            if driver:
-                try:
-                    driver.quit()
-                except:
-                    pass
-    
-    return pd.DataFrame()
+            current, errors = poll_stations(stations)
+        except MidwayAuthError as e:
+            reset_cortex_client()
+            st.error(f"Midway認証エラーのため自動更新を停止しました: {str(e)}")
+            return
+
+        previous = st.session_state.get('rp_snapshot')
+        # ステーションの指定が変わったら比較をやり直す
+        if st.session_state.get('rp_snapshot_stations') != stations:
+            previous = None
+        if previous is not None and errors:
+            # 取得に失敗したステーションは前回の行を引き継ぐ（次回の取得で全員が「新規」にならないように）
+            carried = previous[previous['Station'].isin(list(errors))]
+            current = pd.concat([current, carried], ignore_index=True)
+        changes = diff_snapshots(previous, current)
+        st.session_state.rp_snapshot = current
+        st.session_state.rp_snapshot_stations = stations
+
+        st.caption(f"🕐 最終更新: {datetime.now().strftime('%H:%M:%S')}（{interval}秒毎）")
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("配送員", len(current))
+        col2.metric("完了配達", int(current['完了配達'].sum()), delta=int(changes['完了増分'].sum()) or None)
+        col3.metric("赤リスク", int((current['リスク'] == '赤').sum()))
+        col4.metric("ログアウト", int((current['状態'] == 'ログアウト').sum()), delta=int(changes['_logout'].sum()) or None)
+
+        if previous is None:
+            st.info("初回の取得です。次回の更新から変化した配送員を表示します。")
+        elif changes.empty:
+            st.write("前回から変化した配送員はいません")
+        else:
+            st.dataframe(
+                changes[DELTA_COLUMNS].style.apply(lambda df: delta_styles(changes), axis=None),
+                hide_index=True
+            )
+
+        for station, error in errors.items():
+            carried_note = "（前回のデータを表示しています）" if previous is not None else ""
+            st.warning(f"Station {station}: {error}{carried_note}")
+
+        if st.checkbox("全員を表示", key="rp_live_show_all"):
+            st.dataframe(current, hide_index=True)
+
+    monitor()
 
 def main():
     st.title("Flex配送員情報")
@@ -185,6 +146,8 @@ def main():
     with st.sidebar:
         if st.button("セッションリセット"):
             _, profile_path = check_midway_auth()
+            get_driver_pool().close_all()
+            reset_cortex_client()
             if os.path.exists(profile_path):
                 shutil.rmtree(profile_path)
                 st.success("セッションをリセットしました")
@@ -220,13 +183,28 @@ def main():
 
     selected_stations = list(dict.fromkeys([s.strip() for s in station_input.split('\n') if s.strip()]))
 
+    with st.sidebar:
+        live_mode = st.toggle("🔁 自動更新（変化のみ表示）")
+        interval = st.number_input("更新間隔（秒）", min_value=30, max_value=600, value=60, step=30, disabled=not live_mode)
+
+    if live_mode:
+        if not selected_stations:
+            st.warning("Station Codeを入力してください。")
+        elif not check_midway_auth()[0]:
+            st.warning("先に🔍検索でMidway認証を行ってください。")
+        else:
+            show_live_monitor(selected_stations, int(interval))
+        return
+
     if search_button:
         if selected_stations:
             is_valid, _ = check_midway_auth()
             
             if not is_valid:
                 with st.spinner("Midway認証を実行中..."):
-                    driver = initialize_driver(headless=False)
+                    # 認証用ブラウザと同じプロファイルを使うため、待機中のドライバーは閉じる
+                    get_driver_pool().close_all()
+                    driver = create_driver(headless=False)
                     try:
                         if perform_midway_auth(driver):
                             st.success("認証完了")
@@ -236,6 +214,9 @@ def main():
             with st.spinner("データを取得中..."):
                 all_data = []
                 
+                # ブラウザはCookie取得の1回だけ起動し、以降はHTTPで取得
+                cortex = get_cortex_client(get_driver_pool().driver)
+                
                 # プログレス表示用のコンテナ
                 progress_container = st.container()
                 with progress_container:
@@ -243,17 +224,22 @@ def main():
                     status_text = st.empty()
                     processing_text = st.empty()
                 
-                # 並列処理の実行
-                with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                    future_to_station = {executor.submit(process_station, station): station 
-                                       for station in selected_stations}
-                    
-                    completed = 0
-                    successful = 0
-                    
-                    for future in concurrent.futures.as_completed(future_to_station):
-                        station = future_to_station[future]
+                # プロセス共通の同時実行数・レートの上限内で並列取得（完了順に表示）
+                completed = 0
+                ages = {}
+                successful = 0
+                try:
+                    for station, df, error, age in get_station_cache('rp', CORTEX_TTL_SECONDS).run(
+                        get_station_fetcher(),
+                        selected_stations,
+                        lambda station: process_station(cortex, station),
+                        cache_if=lambda df: not df.empty,
+                        auth_errors=(MidwayAuthError,),
+                        should_retry=lambda df: df.empty
+                    ):
                         completed += 1
+                        if error is None:
+                            ages[station] = age
                         
                         progress = completed / len(selected_stations)
                         progress_percentage = int(progress * 100)
@@ -263,19 +249,23 @@ def main():
                         if status_text is not None:
                             status_text.text(f"処理中... {progress_percentage}% ({completed}/{len(selected_stations)} 件完了)")
                         
-                        try:
-                            df = future.result()
-                            if df is not None and not df.empty:
-                                all_data.append(df)
-                                successful += 1
-                                processing_text.text(f"Station {station}: データ取得成功 ({successful}/{len(selected_stations)}件成功)")
-                            else:
-                                processing_text.text(f"Station {station}: データなし")
-                        except Exception as e:
-                            processing_text.text(f"Station {station}: 処理失敗 - {str(e)}")
+                        if error is not None:
+                            processing_text.text(f"Station {station}: 処理失敗 - {str(error)}")
+                        elif not df.empty:
+                            all_data.append(df)
+                            successful += 1
+                            processing_text.text(f"Station {station}: データ取得成功 ({successful}/{len(selected_stations)}件成功)")
+                        else:
+                            processing_text.text(f"Station {station}: データなし")
+                except MidwayAuthError as e:
+                    # 認証切れは全ステーション共通なので残りは取り消し済み
+                    reset_cortex_client()
+                    processing_text.text(f"Midway認証エラーのため中断しました: {str(e)}")
                 
                 # 処理完了後のメッセージ
                 status_text.text(f"処理完了! (成功: {successful}/{len(selected_stations)}件)")
+                if ages:
+                    st.caption(f"🕐 データの取得時刻: {format_ages(ages)}")
                 
                 # データの表示処理
                 if all_data:
@@ -283,17 +273,7 @@ def main():
                     progress_container.empty()
                     
                     # データの結合と処理
-                    final_df = pd.concat(all_data, ignore_index=True)
-                    
-                    # 電話番号の整形
-                    final_df['電話'] = final_df['電話'].str.replace('+81', '0', regex=False)
-                    final_df['電話'] = final_df['電話'].apply(lambda x: ''.join(filter(str.isdigit, str(x))))
-                    final_df['電話'] = final_df['電話'].apply(lambda x: f"{x[:3]}-{x[3:7]}-{x[7:]}" if len(x) == 11 else x)
-                    
-                    # カラム順序の設定
-                    columns_order = ['Station', '名前', 'ルート', 'TransporterID', '電話', 
-                                   'リスク', '全配達', '完了配達', '状態']
-                    final_df = final_df[columns_order]
+                    final_df = format_summary_table(pd.concat(all_data, ignore_index=True))
                     
                     # データフレームの表示
                     st.dataframe(
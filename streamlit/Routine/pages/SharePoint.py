@@ -1,17 +1,14 @@
 import streamlit as st
-import requests
-from requests_negotiate_sspi import HttpNegotiateAuth
-import urllib3
 from urllib.parse import quote
 import webbrowser
 import os
+import shutil
 from pathlib import Path
 import pandas as pd
 from io import StringIO
 from datetime import datetime
-
-# SSL証明書の警告を無視
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from scripts.sharepoint import get_client
+from scripts.station_index import get_station_index
 
 # SharePointのURL設定
 BASE_URL = "https://share.amazon.com"
@@ -25,21 +22,7 @@ DATA_DIR.mkdir(exist_ok=True)
 def get_files_and_guids():
     """SharePointからファイル一覧とGUIDを一度に取得"""
     try:
-        session = requests.Session()
-        auth = HttpNegotiateAuth()
-        headers = {
-            'Accept': 'application/json;odata=verbose',
-            'Content-Type': 'application/json;odata=verbose',
-            'User-Agent': 'Python NTLM Client'
-        }
-        
-        response = session.get(
-            FOLDER_URL,
-            auth=auth,
-            headers=headers,
-            verify=False,
-            timeout=30
-        )
+        response = get_client().get(FOLDER_URL)
         
         if response.status_code == 200:
             data = response.json()
@@ -101,51 +84,37 @@ def create_browser_url(file_info, guid):
     return f"{BASE_URL}/sites/COJP_ORM/_layouts/15/WopiFrame2.aspx?sourcedoc={{{guid}}}&file={encoded_filename}&action=default"
 
 def download_file(file_info):
-    """ファイルをダウンロードして別セッションで開く"""
+    """ファイルをダウンロードして別セッションで開く（未更新ならキャッシュから）"""
+    temp_file_path = None
     try:
-        session = requests.Session()
-        auth = HttpNegotiateAuth()
         file_url = f"{BASE_URL}{file_info['server_relative_url']}"
         
-        response = session.get(
-            file_url,
-            auth=auth,
-            verify=False,
-            timeout=30,
-            stream=True
-        )
+        # 条件付きGET：304ならローカルキャッシュのコピーを使う
+        cached_path = get_client().download_cached(file_url, key=file_info['server_relative_url'])
         
-        if response.status_code == 200:
-            downloads_path = str(Path.home() / "Downloads")
-            temp_file_path = os.path.join(downloads_path, f"temp_{file_info['name']}")
-            file_path = os.path.join(downloads_path, file_info['name'])
-            
-            with open(temp_file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-            
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            except:
-                base, ext = os.path.splitext(file_path)
-                counter = 1
-                while os.path.exists(file_path):
-                    file_path = f"{base}_{counter}{ext}"
-                    counter += 1
-            
-            os.rename(temp_file_path, file_path)
-            os.system(f'start "" "{file_path}"')
-            return file_path
-            
-        else:
-            st.error(f"ダウンロードに失敗しました。ステータスコード: {response.status_code}")
-            return None
+        downloads_path = str(Path.home() / "Downloads")
+        temp_file_path = os.path.join(downloads_path, f"temp_{file_info['name']}")
+        file_path = os.path.join(downloads_path, file_info['name'])
+        
+        shutil.copyfile(cached_path, temp_file_path)
+        
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except:
+            base, ext = os.path.splitext(file_path)
+            counter = 1
+            while os.path.exists(file_path):
+                file_path = f"{base}_{counter}{ext}"
+                counter += 1
+        
+        os.rename(temp_file_path, file_path)
+        os.system(f'start "" "{file_path}"')
+        return file_path
             
     except Exception as e:
         st.error(f"ダウンロードエラー: {str(e)}")
-        if os.path.exists(temp_file_path):
+        if temp_file_path and os.path.exists(temp_file_path):
             try:
                 os.remove(temp_file_path)
             except:
@@ -191,9 +160,7 @@ with st.sidebar:
     cortex_code = st.text_input(label="Cortex DS Code", key="cortex").upper()
     if cortex_code != st.session_state.get('last_cortex', ''):
         try:
-            df = pd.read_csv(DATA_DIR / 'dsp_info.csv')
-            df['station_code'] = df['station_code'].str.upper()
-            service_area_id = df[df['station_code'] == cortex_code]['service_area_id'].iloc[0]
+            service_area_id = get_station_index(DATA_DIR / 'dsp_info.csv').lookup(cortex_code)
             cortex_url = f"https://logistics.amazon.co.jp/internal/operations/execution/itineraries?provider=ALL_DRIVERS&selectedDay={today}&serviceAreaId={service_area_id}"
             webbrowser.open(cortex_url)
             st.success(f"Opening Cortex for {cortex_code}")
@@ -208,9 +175,7 @@ with st.sidebar:
     roster_code = st.text_input(label="Roster DS Code", key="roster").upper()
     if roster_code != st.session_state.get('last_roster', ''):
         try:
-            df = pd.read_csv(DATA_DIR / 'dsp_info.csv')
-            df['station_code'] = df['station_code'].str.upper()
-            service_area_id = df[df['station_code'] == roster_code]['service_area_id'].iloc[0]
+            service_area_id = get_station_index(DATA_DIR / 'dsp_info.csv').lookup(roster_code)
             roster_url = f"https://logistics.amazon.co.jp/internal/capacity/rosterview?serviceAreaId={service_area_id}&date={today}"
             webbrowser.open(roster_url)
             st.success(f"Opening Roster for {roster_code}")
@@ -225,9 +190,7 @@ with st.sidebar:
     sui_code = st.text_input(label="SUI DS Code", key="sui").upper()
     if sui_code != st.session_state.get('last_sui', ''):
         try:
-            df = pd.read_csv(DATA_DIR / 'dsp_info.csv')
-            df['station_code'] = df['station_code'].str.upper()
-            service_area_id = df[df['station_code'] == sui_code]['service_area_id'].iloc[0]
+            service_area_id = get_station_index(DATA_DIR / 'dsp_info.csv').lookup(sui_code)
             sui_url = f"https://logistics.amazon.co.jp/internal/scheduling/dsps?serviceAreaId={service_area_id}&date={today}"
             webbrowser.open(sui_url)
             st.success(f"Opening SUI for {sui_code}")
@@ -244,9 +207,7 @@ with st.sidebar:
         file_name = 'dsp_info.csv'
         
         try:
-            session = requests.Session()
-            auth = HttpNegotiateAuth()
-            response = session.get(url, auth=auth, verify=False, timeout=30)
+            response = get_client().get(url)
             
             if response.status_code == 200:
                 df = pd.read_csv(
@@ -1,60 +1,20 @@
 import pandas as pd
 import os
-from pathlib import Path
 import streamlit as st
 from datetime import datetime
 import warnings
 import time
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
 import shutil
-import json
+from scripts.webdriver_pool import PROFILE_PATH, create_driver, get_driver_pool
+from scripts.cortex_summary import parse_summaries, format_summary_table
+from scripts.cortex import get_cortex_client, reset_cortex_client, MidwayAuthError
+from scripts.station_index import get_station_index
+from scripts.roster import fetch_roster, roster_url
 warnings.filterwarnings('ignore')
 
-# プロファイルパスを定数として定義
-PROFILE_PATH = f"C:\\Users\\{os.getenv('USERNAME')}\\AppData\\Local\\Google\\Chrome\\python"
-
-def initialize_driver(headless=False):
-    """ドライバーの初期化と認証を行う"""
-    username = os.getenv('USERNAME')
-    
-    options = webdriver.ChromeOptions()
-    options.add_argument(f'--user-data-dir={PROFILE_PATH}')
-    options.add_argument('--disable-gpu')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    options.add_argument('--disable-software-rasterizer')
-    
-    if headless:
-        options.add_argument('--headless=new')
-        options.add_argument('--disable-extensions')
-    
-    options.add_experimental_option('excludeSwitches', ['enable-logging'])
-    
-    # 既存のプロファイルをクリーンアップ
-    try:
-        if os.path.exists(PROFILE_PATH):
-            shutil.rmtree(PROFILE_PATH)
-        os.makedirs(PROFILE_PATH, exist_ok=True)
-    except Exception as e:
-        print(f"プロファイルのクリーンアップエラー: {str(e)}")
-    
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            service = Service(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=options)
-            return driver
-        except Exception as e:
-            if attempt == max_retries - 1:
-                raise
-            print(f"ドライバー初期化リトライ {attempt + 1}/{max_retries}")
-            time.sleep(2)
-
 def check_midway_auth():
     """Midway認証の有効期限をチェック"""
     midway_file = os.path.join(PROFILE_PATH, 'Midway')
@@ -97,70 +57,15 @@ def perform_midway_auth(driver):
     return True
 
 def get_service_area_id(station_code: str) -> str:
-    df = pd.read_csv("C:\\Users\\tangtao\\Desktop\\TAO\\Routine\\data\\dsp_info.csv")
-    return str(df[df['station_code'] == station_code]['service_area_id'].iloc[0])
+    return get_station_index("C:\\Users\\tangtao\\Desktop\\TAO\\Routine\\data\\dsp_info.csv").lookup(station_code)
 
-def get_delivery_info(driver, station_code):
+def get_delivery_info(cortex, station_code):
     max_retries = 3
     for attempt in range(max_retries):
         try:
             service_area_id = get_service_area_id(station_code)
-            date_str = datetime.now().strftime('%Y-%m-%d')
-            
-            api_url = f"https://logistics.amazon.co.jp/internal/operations/execution/api/summaries?historicalDay=false&localDate={date_str}&serviceAreaId={service_area_id}"
-            
-            driver.get(api_url)
-            wait = WebDriverWait(driver, 30)  # タイムアウトを30秒に延長
-            
-            # ページの完全なロードを待機
-            wait.until(lambda d: d.execute_script("return document.readyState") == "complete")
-            time.sleep(2)  # 追加の待機時間
-            
-            # preタグの存在を確認
-            pre_element = wait.until(
-                EC.presence_of_element_located((By.TAG_NAME, "pre")),
-                message="JSONデータが見つかりません"
-            )
-            
-            json_text = pre_element.text
-            if not json_text:
-                raise ValueError("JSONデータが空です")
-            
-            data = json.loads(json_text)
-            delivery_data = []
-            
-            for itinerary in data.get('itinerarySummaries', []):
-                try:
-                    transporter_id = itinerary.get('transporterId')
-                    transporter_info = next((t for t in data.get('transporters', []) 
-                                          if t.get('transporterId') == transporter_id), {})
-                    
-                    route_codes = itinerary.get('routeCodes', [])
-                    route_str = ' '.join(str(code) for code in route_codes) if route_codes else ''
-                    
-                    progress_status = itinerary.get('progressStatus', '')
-                    risk_status = {'BEHIND': '赤', 'AT_RISK': '黄'}.get(progress_status, '青')
-                    
-                    route_delivery_progress = itinerary.get('routes', [{}])[0].get('routeDeliveryProgress', {})
-                    total_deliveries = route_delivery_progress.get('totalDeliveries', 0)
-                    completed_deliveries = route_delivery_progress.get('completedDeliveries', 0)
-                    
-                    delivery_data.append({
-                        "名前": f"{transporter_info.get('firstName', '')} {transporter_info.get('lastName', '')}".strip(),
-                        "ルート": route_str,
-                        "TransporterID": transporter_id,
-                        "電話": transporter_info.get('workPhoneNumber', ''),
-                        "リスク": risk_status,
-                        "全配達": total_deliveries,
-                        "完了配達": completed_deliveries,
-                        "状態": "ログアウト" if itinerary.get('sessionEndTime') else ""
-                    })
-                    
-                except Exception as e:
-                    print(f"配送員データの処理中にエラー: {str(e)}")
-                    continue
-            
-            df = pd.DataFrame(delivery_data)
+            data = cortex.get_summaries(service_area_id)
+            df = parse_summaries(data)
             if df.empty:
                 if attempt < max_retries - 1:
                     print(f"データが空です。リトライ {attempt + 1}/{max_retries}")
@@ -169,17 +74,14 @@ def get_delivery_info(driver, station_code):
                 else:
                     raise ValueError("データを取得できませんでした")
                     
-            if not df.empty:
-                numeric_columns = ['全配達', '完了配達']
-                df[numeric_columns] = df[numeric_columns].astype(int)
-            
             return df
                 
+        except MidwayAuthError:
+            raise
         except Exception as e:
             if attempt < max_retries - 1:
                 print(f"エラーが発生しました。リトライ {attempt + 1}/{max_retries}: {str(e)}")
                 time.sleep(3)
-                driver.refresh()
                 continue
             else:
                 raise
@@ -188,68 +90,8 @@ def get_delivery_info(driver, station_code):
 
 def get_roster_data(driver, station_code):
     try:
-        service_area_id = get_service_area_id(station_code)
-        date_str = datetime.now().strftime('%Y-%m-%d')
-        roster_url = f"https://logistics.amazon.co.jp/internal/capacity/rosterview?serviceAreaId={service_area_id}&date={date_str}"
-        
-        driver.get(roster_url)
-        wait = WebDriverWait(driver, 30)
-        
-        max_retries = 5
-        roster_data = []
-        
-        for attempt in range(max_retries):
-            try:
-                wait.until(lambda d: d.execute_script("return document.readyState") == "complete")
-                time.sleep(2)
-                
-                try:
-                    flex_table = wait.until(EC.presence_of_element_located((By.ID, "cspDATable")))
-                    wait.until(EC.visibility_of_element_located((By.ID, "cspDATable")))
-                except Exception:
-                    if attempt < max_retries - 1:
-                        time.sleep(3)
-                        driver.refresh()
-                        continue
-                    else:
-                        raise
-                
-                flex_rows = flex_table.find_elements(By.TAG_NAME, "tr")[1:]
-                
-                if not flex_rows and attempt < max_retries - 1:
-                    time.sleep(3)
-                    driver.refresh()
-                    continue
-                
-                for row in flex_rows:
-                    try:
-                        cols = wait.until(lambda d: row.find_elements(By.TAG_NAME, "td"))
-                        if len(cols) >= 7:
-                            data = {
-                                "DP ID": cols[0].text.strip(),
-                                "DP名": cols[1].text.strip(),
-                                "ステータス": cols[2].text.strip(),
-                                "サービスタイプ": cols[3].text.strip(),
-                                "開始時刻": cols[5].text.strip(),
-                                "終了時間": cols[6].text.strip(),
-                                "サイクル": cols[-1].text.strip()
-                            }
-                            if any(data.values()):
-                                roster_data.append(data)
-                    except Exception:
-                        continue
-                
-                if roster_data:
-                    break
-                
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    time.sleep(3)
-                    driver.refresh()
-                    continue
-                else:
-                    raise
-        
+        # テーブル全体を execute_script 1回で読む（固定の sleep・セル毎の取得はしない）
+        roster_data = fetch_roster(driver, roster_url(get_service_area_id(station_code)))
         return pd.DataFrame(roster_data).fillna('')
         
     except Exception as e:
@@ -269,6 +111,8 @@ def main():
     # Midwayリセットボタン
     if st.sidebar.button("Midwayリセット"):
         try:
+            get_driver_pool().close_all()
+            reset_cortex_client()
             if os.path.exists(PROFILE_PATH):
                 shutil.rmtree(PROFILE_PATH)
                 st.sidebar.success("Midwayセッションをリセットしました")
@@ -280,7 +124,9 @@ def main():
         with st.spinner("Midway認証を実行中..."):
             driver = None
             try:
-                driver = initialize_driver(headless=False)
+                # 認証用ブラウザと同じプロファイルを使うため、待機中のドライバーは閉じる
+                get_driver_pool().close_all()
+                driver = create_driver(headless=False)
                 perform_midway_auth(driver)
                 st.success("認証完了")
             except Exception as e:
@@ -297,22 +143,18 @@ def main():
 
     if station_input:
         with st.spinner(f"Station {station_input} のデータを取得中..."):
-            driver = None
             try:
-                driver = initialize_driver(headless=True)
-                
                 if app_mode == "Cortex":
-                    df = get_delivery_info(driver, station_input)
+                    # ブラウザはCookie取得の1回だけ起動し、以降はHTTPで取得
+                    cortex = get_cortex_client(get_driver_pool().driver)
+                    df = get_delivery_info(cortex, station_input)
                     if not df.empty:
                         df['Station'] = station_input
-                        df['電話'] = df['電話'].str.replace('+81', '0').apply(
-                            lambda x: ''.join(filter(str.isdigit, str(x)))).apply(
-                            lambda x: f"{x[:3]}-{x[3:7]}-{x[7:]}" if len(x) == 11 else x)
-                        
-                        columns_order = ['Station', '名前', 'ルート', 'TransporterID', '電話', 
-                                       'リスク', '全配達', '完了配達', '状態']
+                        df = format_summary_table(df)
+                        columns_order = list(df.columns)
                 else:
-                    df = get_roster_data(driver, station_input)
+                    with get_driver_pool().driver() as driver:
+                        df = get_roster_data(driver, station_input)
                     if not df.empty:
                         df['Station'] = station_input
                         columns_order = ['Station', 'DP名', 'DP ID', 'ステータス', 
@@ -325,14 +167,11 @@ def main():
                                             for col in final_df.columns})
                     st.info(f"総配送員数: {len(final_df)}")
                 
+            except MidwayAuthError as e:
+                reset_cortex_client()
+                st.error(f"Station {station_input}: {str(e)}")
             except Exception as e:
                 st.error(f"Station {station_input}: {str(e)}")
-            finally:
-                if driver is not None:
-                    try:
-                        driver.quit()
-                    except:
-                        pass
 
 if __name__ == "__main__":
     main()
@@ -1,17 +1,17 @@
 import os
 import pandas as pd
 import streamlit as st
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from datetime import datetime
 import shutil
-import json
-import concurrent.futures
-import time
+from scripts.webdriver_pool import create_driver, get_driver_pool
+from scripts.cortex_summary import parse_summaries, format_summary_table
+from scripts.cortex import get_cortex_client, reset_cortex_client, MidwayAuthError
+from scripts.station_fetch import get_station_fetcher
+from scripts.station_cache import CORTEX_TTL_SECONDS, format_ages, get_station_cache
+from scripts.station_index import get_station_index
 
 USERNAME = os.getenv('USERNAME')
 MIDWAY_FILE = f"C:\\Users\\{USERNAME}\\AppData\\Local\\Google\\Chrome\\python\\Midway"
@@ -28,20 +28,8 @@ def update_midway_auth():
         f.write(datetime.now().strftime('%Y/%m/%d'))
         
 def get_service_area_id(station_code: str) -> str:
-    df = pd.read_csv("data\\dsp_info.csv")
-    return set(df[df['station_code'] == station_code]['service_area_id'].iloc[0])
+    return get_station_index("data\\dsp_info.csv").lookup(station_code)
 
-def initialize_driver(headless=False):
-    profile_path = f"C:\\Users\\{USERNAME}\\AppData\\Local\\Google\\Chrome\\python"
-    options = webdriver.ChromeOptions()
-    options.add_argument(f'--user-data-dir={profile_path}')
-    options.add_argument('--disable-gpu')
-    if headless:
-        options.add_argument('--headless=new')
-    #options.add_experimental_option('excludeSwitches', ['enable-logging'])
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-    return driver
-    
 def perform_midway_auth(driver):
     hng_path = f"C:\\Users\\{USERNAME}\\AppData\\Local\\Google\\Chrome\\__hng"
     wait = WebDriverWait(driver, 60)
@@ -60,71 +48,22 @@ def perform_midway_auth(driver):
     update_midway_auth()
     return True
     
-def get_cortex_data(driver, node):
-    try:
-        service_area_id = get_service_area_id(node)
-        today = datetime.now().strftime('%Y-%m-%d')
-        
-        api_url = f"https://logistics.amazon.co.jp/internal/operations/execution/api/summaries?historicalDay=false&localDate={today}&serviceAreaId={service_area_id}"
-        driver.get(api_url)
-        
-        wait = WebDriverWait(driver, 180)
-        json_text = wait.until(EC.presence_of_element_located((By.TAG_NAME, 'pre'))).text
-        
-        data = json.loads(json_text)
-        dp_data =[]
-        
-        for itinerary in data.get('itinerarySummaries', []):
-            try:
-                transporter_id = itinerary.get('transporterId')
-                transporter_info = next((t for t in data.get('transporters', []) if t.get('transporterId') == transporter_id), {})
-                
-                route_codes = itinerary.get('routeCodes', [])
-                route = ','.join(str(r) for r in route) if route else ''
-                
-                progress_status = itinerary.get('progressStatus', '')
-                risk_status = {'BEHIND': '赤', 'AT_RISK': '黄'}.get(progress_status, '青')
-                
-                route_delivery_progress = itinerary.get('routes', [{}])[0].get('routeDeliveryProgress', {})
-                total_deliveries = route_delivery_progress.get('totalDeliveries', 0)
-                completed_deliveries = route_delivery_progress.get('completedDeliveries', 0)
-                
-                dp_data.append({
-                    "Name": f"{transporter_info.get('firstName', '')} {transporter_info.get('lastName', '')}".strip(),
-                    "Route": route,
-                    "Id": transporter_id,
-                    "Phone": transporter_info.get('workPhoneNumber', ''),
-                    "Pkg_done" : completed_deliveries,
-                    "Pkg_total": total_deliveries,
-                    "Risk": risk_status
-                })
-
-            except Exception:
-                continue
-                
-        if dp_data:
-            df = pd.DataFrame(dp_data)
-            return df
-        
-    except Exception as e:
-        st.error(f"Station {node}: エラー発生 - {str(e)}")
-            
-    return pd.DataFrame
+def get_cortex_data(cortex, node):
+    """再試行・認証エラー時の取り消しは StationFetcher が行う"""
+    data = cortex.get_summaries(get_service_area_id(node))
+    df = parse_summaries(data, route_sep=',')
+    if df.empty:
+        return df
+    return df.rename(columns={
+        '名前': 'Name', 'ルート': 'Route', 'TransporterID': 'Id', '電話': 'Phone',
+        '完了配達': 'Pkg_done', '全配達': 'Pkg_total', 'リスク': 'Risk'
+    })[['Name', 'Route', 'Id', 'Phone', 'Pkg_done', 'Pkg_total', 'Risk']]
 
-def cortex_process(node):
-    driver = None
-    try:
-        driver = initialize_driver(headless=True)
-        df = get_cortex_data(driver, node)
-        if df:
-            df['Node'] = node
-            return df
-    except Exception as e:
-        st.error(f"Station {node} の処理中にエラー: {str(e)}")
-    finally:
-        if driver:
-            driver.quit()
-    return pd.DataFrame()
+def cortex_process(cortex, node):
+    df = get_cortex_data(cortex, node)
+    if not df.empty:
+        df['Node'] = node
+    return df
 
 def main():
     st.title('Flex配送員情報')
@@ -132,6 +71,8 @@ def main():
     with st.sidebar:
         if st.button('Midway reset'):
             _, profile_path = check_midway_auth()
+            get_driver_pool().close_all()
+            reset_cortex_client()
             if os.path.exists(profile_path):
                 shutil.rmtree(profile_path)
                 st.success('セッションをリセットしました')
@@ -152,7 +93,9 @@ def main():
         
         if not is_valid:
             with st.spinner('Midway認証を実行中🤡☠️👻🙈🙉🙊'):
-                driver = initialize_driver(headless=False)
+                # 認証用ブラウザと同じプロファイルを使うため、待機中のドライバーは閉じる
+                get_driver_pool().close_all()
+                driver = create_driver(headless=False)
                 try:
                     if perform_midway_auth(driver):
                         st.success('認証完了')
@@ -162,22 +105,29 @@ def main():
         with st.spinner('Cortexからデータを取得中...'):
             all_data = []
             
+            # ブラウザはCookie取得の1回だけ起動し、以降はHTTPで取得
+            cortex = get_cortex_client(get_driver_pool().driver)
+            
             progress_container = st.container()
             with progress_container:
                 progress_bar = st.progress(0)
                 status_text = st.empty()
                 processing_text = st.empty()
                 
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                future_to_station = {executor.submit(cortex_process, station): station
-                                    for station in selected_stations}
-                
-                completed = 0
-                successful = 0
-                
-                for future in concurrent.futures.as_completed(future_to_station):
-                    station = future_to_station[future]
+            # プロセス共通の同時実行数・レートの上限内で並列取得（完了順に表示）
+            completed = 0
+            ages = {}
+            successful = 0
+            try:
+                for station, df, error, age in get_station_cache('mymidway', CORTEX_TTL_SECONDS).run(
+                    get_station_fetcher(),
+                    selected_stations,
+                    lambda station: cortex_process(cortex, station),
+                    auth_errors=(MidwayAuthError,)
+                ):
                     completed += 1
+                    if error is None:
+                        ages[station] = age
                     
                     progress = completed / len(selected_stations)
                     progress_percentage = int(progress * 100)
@@ -187,29 +137,30 @@ def main():
                     if status_text is not None:
                         status_text.text(f"処理中...{progress_percentage}% ({completed} / {len(selected_stations)}件完了) ")
                         
-                    try:
-                        df = future.result()
-                        if df is not None and not df.empty:
-                            all_data.append(df)
-                            successful += 1
-                            processing_text.text(f"Station {station}: データ取得成功 ({successful}/{len(selected_stations)}件成功)")
-                        else:
-                            processing_text.text(f"Station {station}: データなし")
-                    except Exception as e:
-                        processing_text.text(f"Station {station}: 処理失敗 - {str(e)}")
+                    if error is not None:
+                        processing_text.text(f"Station {station}: 処理失敗 - {str(error)}")
+                    elif not df.empty:
+                        all_data.append(df)
+                        successful += 1
+                        processing_text.text(f"Station {station}: データ取得成功 ({successful}/{len(selected_stations)}件成功)")
+                    else:
+                        processing_text.text(f"Station {station}: データなし")
+            except MidwayAuthError as e:
+                # 認証切れは全ステーション共通なので残りは取り消し済み
+                reset_cortex_client()
+                processing_text.text(f"Midway認証エラーのため中断しました: {str(e)}")
                         
             status_text.text(f"処理完了! (成功: {successful}/{len(selected_stations)}件)")
+            if ages:
+                st.caption(f"🕐 データの取得時刻: {format_ages(ages)}")
             
             if all_data:
                 progress_container.empty()
                 final_df = pd.concat(all_data,ignore_index=True)
                 
-                final_df['電話'] = final_df['電話'].str.replace('+81', '0', regex=False)
-                final_df['電話'] = final_df['電話'].apply(lambda x: ''.join(filter(str.isdigit, str(x))))
-                final_df['電話'] = final_df['電話'].apply(lambda x: f'{x[:3]}-{x[3:7]}-{x[7:]}' if len(x) == 11 else x)
-                
+                # 列名は get_cortex_data で英語に変えてあるので Phone 列を整形する
                 columns_order = ['Node', 'Name', 'Route', 'Id', 'Phone', 'Risk', 'Pkg_done', 'Pkg_total']
-                final_df = final_df[columns_order]
+                final_df = format_summary_table(final_df, columns_order, phone_column='Phone')
                 
                 st.dataframe(final_df, hide_index=True,
                             column_config={col: st.column_config.Column(width='small') for col in final_df.columns})
@@ -0,0 +1,106 @@
+"""Cortex summaries API クライアント
+
+ステーション毎にChromeを起動して <pre> からJSONを読む代わりに、
+Seleniumで一度だけMidwayのCookieを取得し、以降はHTTPセッションで直接APIを呼ぶ。
+"""
+import threading
+from datetime import datetime
+from typing import Callable, ContextManager, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+from urllib3.util.retry import Retry
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+LOGISTICS_BASE_URL = "https://logistics.amazon.co.jp/internal"
+SUMMARIES_URL = f"{LOGISTICS_BASE_URL}/operations/execution/api/summaries"
+MIDWAY_URL = "https://midway-auth.amazon.com"
+
+
+class MidwayAuthError(Exception):
+    """Midway認証切れ（Cookieの再取得が必要）"""
+
+
+class CortexClient:
+    def __init__(self, cookies: list, user_agent: Optional[str] = None, pool_size: int = 10, timeout: float = 30):
+        self.timeout = timeout
+        self.harvested_on = datetime.now().strftime('%Y/%m/%d')
+
+        self.session = requests.Session()
+        self.session.headers.update({'Accept': 'application/json'})
+        if user_agent:
+            self.session.headers['User-Agent'] = user_agent
+        for cookie in cookies:
+            self.session.cookies.set(
+                cookie['name'], cookie['value'],
+                domain=cookie.get('domain'), path=cookie.get('path', '/')
+            )
+
+        retry = Retry(
+            total=2,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def from_driver(cls, driver, **kwargs) -> 'CortexClient':
+        """認証済みのWebDriverからMidway/LogisticsのCookieを取得"""
+        cookies = []
+        for url in (MIDWAY_URL, LOGISTICS_BASE_URL):
+            driver.get(url)
+            cookies.extend(driver.get_cookies())
+        user_agent = driver.execute_script("return navigator.userAgent")
+        return cls(cookies, user_agent=user_agent, **kwargs)
+
+    @property
+    def expired(self) -> bool:
+        # Midway認証は1日単位
+        return self.harvested_on != datetime.now().strftime('%Y/%m/%d')
+
+    def get_summaries(self, service_area_id: str, date_str: Optional[str] = None) -> dict:
+        """summaries APIのJSONを取得"""
+        params = {
+            'historicalDay': 'false',
+            'localDate': date_str or datetime.now().strftime('%Y-%m-%d'),
+            'serviceAreaId': service_area_id
+        }
+        response = self.session.get(SUMMARIES_URL, params=params, timeout=self.timeout, verify=False)
+
+        # 認証切れの場合はMidwayのログイン画面へリダイレクトされる
+        if (response.status_code in (401, 403)
+                or MIDWAY_URL in response.url
+                or 'text/html' in response.headers.get('Content-Type', '')):
+            raise MidwayAuthError(f"Midway認証が必要です (status {response.status_code})")
+
+        response.raise_for_status()
+        return response.json()
+
+
+_client: Optional[CortexClient] = None
+_client_lock = threading.Lock()
+
+
+def get_cortex_client(driver_context: Callable[[], ContextManager]) -> CortexClient:
+    """プロセス共通のクライアントを返す（未取得・日付切れの場合のみブラウザを使う）
+
+    driver_context は WebDriverを貸し出すコンテキストマネージャ（DriverPool.driver など）。
+    """
+    global _client
+    with _client_lock:
+        if _client is None or _client.expired:
+            with driver_context() as driver:
+                _client = CortexClient.from_driver(driver)
+        return _client
+
+
+def reset_cortex_client() -> None:
+    """認証エラー時に呼び、次回Cookieを取り直す"""
+    global _client
+    with _client_lock:
+        _client = None
@@ -0,0 +1,67 @@
+"""Cortex配送員一覧の差分（自動更新モード用）
+
+ポーリングの度に全行を描画し直さず、前回のスナップショットと
+(Station, TransporterID) で突き合わせて、完了配達の増分・リスクの変化・
+ログアウト・新規の配送員だけを抜き出す。突き合わせは1回のmergeで行う。
+"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+DELTA_KEY = ['Station', 'TransporterID']
+DELTA_COLUMNS = ['Station', '名前', 'ルート', 'TransporterID', 'リスク', '全配達', '完了配達', '状態', '完了増分', '変化']
+LOGOUT = 'ログアウト'
+
+# 変化の種類毎のハイライト（対象の列）
+DELTA_CSS = {
+    '完了配達': 'background-color: #c8e6c9;',
+    'リスク': 'background-color: #ffcdd2;',
+    '状態': 'background-color: #e0e0e0;',
+}
+NEW_ROW_CSS = 'background-color: #fff9c4;'
+
+
+def diff_snapshots(previous: Optional[pd.DataFrame], current: pd.DataFrame) -> pd.DataFrame:
+    """前回から変化した配送員の行（DELTA_COLUMNS + 判定用の _new/_done/_risk/_logout 列）
+
+    previous が None（初回）の場合は変化なしとして空を返す。
+    """
+    if previous is None or current.empty:
+        return pd.DataFrame(columns=DELTA_COLUMNS + ['_new', '_done', '_risk', '_logout'])
+
+    before = previous[DELTA_KEY + ['完了配達', 'リスク', '状態']].drop_duplicates(DELTA_KEY)
+    merged = current.merge(before, on=DELTA_KEY, how='left', suffixes=('', '_前'), indicator=True)
+
+    new = (merged['_merge'] == 'left_only').to_numpy()
+    done = (merged['完了配達'] - merged['完了配達_前'].fillna(merged['完了配達'])).astype(int).to_numpy()
+    risk = ~new & (merged['リスク'] != merged['リスク_前']).to_numpy()
+    logout = ~new & ((merged['状態'] == LOGOUT) & (merged['状態_前'] != LOGOUT)).to_numpy()
+
+    # 変化の説明を列毎に作り、空でないものを ' / ' でつなぐ
+    parts = pd.DataFrame({
+        'new': np.where(new, '新規', ''),
+        'done': np.where(done > 0, '完了 +' + pd.Series(done).astype(str), ''),
+        'risk': np.where(risk, 'リスク ' + merged['リスク_前'].fillna('').astype(str) + '→' + merged['リスク'].astype(str), ''),
+        'logout': np.where(logout, LOGOUT, ''),
+    })
+    merged['変化'] = (
+        parts['new'].str.cat(parts[['done', 'risk', 'logout']], sep=' / ')
+        .str.replace(r'( / )+', ' / ', regex=True)
+        .str.strip(' /')
+    )
+    merged['完了増分'] = done
+    merged['_new'], merged['_done'], merged['_risk'], merged['_logout'] = new, done > 0, risk, logout
+
+    changed = new | (done > 0) | risk | logout
+    return merged.loc[changed, DELTA_COLUMNS + ['_new', '_done', '_risk', '_logout']].reset_index(drop=True)
+
+
+def delta_styles(changes: pd.DataFrame, columns=DELTA_COLUMNS) -> pd.DataFrame:
+    """変化した項目のセルをハイライトするCSS（Styler.apply(axis=None) 用）"""
+    css = pd.DataFrame('', index=changes.index, columns=list(columns))
+    css.loc[changes['_new'].to_numpy(dtype=bool), :] = NEW_ROW_CSS
+    for flag, column in (('_done', '完了配達'), ('_risk', 'リスク'), ('_logout', '状態')):
+        if column in css.columns:
+            css.loc[changes[flag].to_numpy(dtype=bool), column] = DELTA_CSS[column]
+    return css
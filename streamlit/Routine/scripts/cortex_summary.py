@@ -0,0 +1,159 @@
+"""Cortex summaries JSON の解析と表示用の整形
+
+行程(itinerary)毎に transporters / companies を線形探索せず、
+ペイロード毎に1回だけ索引を作って列単位で DataFrame を組み立てる。
+表示用の電話番号の整形も行毎の apply ではなく文字列メソッドで列全体に行う。
+"""
+from typing import Optional
+
+import pandas as pd
+
+SUMMARY_COLUMNS = ['名前', 'ルート', 'TransporterID', '電話', 'リスク', '全配達', '完了配達', '状態']
+DISPLAY_COLUMNS = ['Station', '名前', 'ルート', 'TransporterID', '電話', 'リスク', '全配達', '完了配達', '状態']
+RISK_MAP = {'BEHIND': '赤', 'AT_RISK': '黄'}
+
+
+def _route_progress(itinerary) -> Optional[dict]:
+    """先頭ルートの routeDeliveryProgress（取り出せない行程は None）"""
+    try:
+        route_progress = itinerary.get('routes', [{}])[0].get('routeDeliveryProgress', {})
+    except (AttributeError, IndexError, KeyError, TypeError):
+        return None
+    return route_progress if isinstance(route_progress, dict) else None
+
+
+def parse_summaries(data: dict, company_name: str = None, route_sep: str = ' ') -> pd.DataFrame:
+    """summaries APIのJSONを配送員1行のDataFrameに変換
+
+    company_name を指定するとその会社（例: 'Amazon Flex'）の行程のみを返す。
+    """
+    # 形式が崩れている行程（routes が空・進捗が null など）は従来どおりその行程だけ除外する
+    itineraries, progress = [], []
+    for itinerary in data.get('itinerarySummaries') or []:
+        route_progress = _route_progress(itinerary)
+        if route_progress is not None:
+            itineraries.append(itinerary)
+            progress.append(route_progress)
+    if not itineraries:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+
+    df = pd.DataFrame({
+        'TransporterID': [i.get('transporterId') for i in itineraries],
+        'companyId': [i.get('companyId') for i in itineraries],
+        'ルート': [route_sep.join(str(code) for code in i.get('routeCodes') or []) for i in itineraries],
+        'progressStatus': [i.get('progressStatus', '') for i in itineraries],
+        '全配達': [p.get('totalDeliveries', 0) for p in progress],
+        '完了配達': [p.get('completedDeliveries', 0) for p in progress],
+        'sessionEndTime': [i.get('sessionEndTime') for i in itineraries],
+    })
+
+    if company_name is not None:
+        companies = {c.get('companyId'): c.get('companyName') for c in data.get('companies', [])}
+        df = df[df['companyId'].map(companies) == company_name]
+
+    # transporterId で一度だけ結合（ハッシュ結合）
+    transporters = pd.DataFrame(
+        data.get('transporters', []),
+        columns=['transporterId', 'firstName', 'lastName', 'workPhoneNumber']
+    ).drop_duplicates('transporterId')
+    df = df.merge(transporters, how='left', left_on='TransporterID', right_on='transporterId')
+
+    df['名前'] = (df['firstName'].fillna('') + ' ' + df['lastName'].fillna('')).str.strip()
+    df['電話'] = df['workPhoneNumber'].fillna('')
+    df['リスク'] = df['progressStatus'].map(RISK_MAP).fillna('青')
+    df['状態'] = df['sessionEndTime'].fillna('').astype(bool).map({True: 'ログアウト', False: ''})
+    df[['全配達', '完了配達']] = df[['全配達', '完了配達']].fillna(0).astype(int)
+
+    return df[SUMMARY_COLUMNS]
+
+
+def normalize_phones(phones: pd.Series) -> pd.Series:
+    """'+81 90-1234-5678' → '090-1234-5678'（数字が11桁でなければ数字のみ）
+
+    object型の str メソッドは要素毎のPythonループになるため、pyarrowの文字列型で
+    列全体を置換してから object型に戻す。
+    """
+    digits = (
+        phones.fillna('').astype(str).astype('string[pyarrow]')
+        .str.replace('+81', '0', regex=False)
+        .str.replace(r'[^0-9]', '', regex=True)
+    )
+    return digits.str.replace(r'^([0-9]{3})([0-9]{4})([0-9]{4})$', r'\1-\2-\3', regex=True).astype(object)
+
+
+def format_summary_table(df: pd.DataFrame, columns=DISPLAY_COLUMNS, phone_column: str = '電話') -> pd.DataFrame:
+    """表示用に電話番号を整形し、columns の順に並べる"""
+    return df.assign(**{phone_column: normalize_phones(df[phone_column])})[columns]
+
+
+if __name__ == "__main__":
+    # マイクロベンチマーク: 2,000行程の疑似ペイロードで旧実装（線形探索）と比較
+    import random
+    import timeit
+
+    def make_payload(n_itineraries=2000, n_companies=20):
+        companies = [{'companyId': f'C{c}', 'companyName': 'Amazon Flex' if c == 0 else f'DSP{c}'}
+                     for c in range(n_companies)]
+        transporters = [{'transporterId': f'T{t}', 'firstName': f'First{t}', 'lastName': f'Last{t}',
+                         'workPhoneNumber': f'+8190{t:08d}'} for t in range(n_itineraries)]
+        itineraries = [{
+            'transporterId': f'T{t}',
+            'companyId': f'C{random.randrange(n_companies)}',
+            'routeCodes': [f'CX{t}'],
+            'progressStatus': random.choice(['BEHIND', 'AT_RISK', 'ON_TRACK']),
+            'routes': [{'routeDeliveryProgress': {'totalDeliveries': 150, 'completedDeliveries': random.randrange(150)}}],
+            'sessionEndTime': random.choice([None, '2025-01-01T20:00:00Z'])
+        } for t in range(n_itineraries)]
+        return {'itinerarySummaries': itineraries, 'transporters': transporters, 'companies': companies}
+
+    def parse_linear(data):
+        rows = []
+        for itinerary in data.get('itinerarySummaries', []):
+            company_info = next((c for c in data.get('companies', []) if c.get('companyId') == itinerary.get('companyId')), {})
+            transporter_id = itinerary.get('transporterId')
+            transporter_info = next((t for t in data.get('transporters', []) if t.get('transporterId') == transporter_id), {})
+            progress = itinerary.get('routes', [{}])[0].get('routeDeliveryProgress', {})
+            rows.append({
+                "名前": f"{transporter_info.get('firstName', '')} {transporter_info.get('lastName', '')}".strip(),
+                "ルート": ' '.join(str(code) for code in itinerary.get('routeCodes', [])),
+                "TransporterID": transporter_id,
+                "電話": transporter_info.get('workPhoneNumber', ''),
+                "リスク": RISK_MAP.get(itinerary.get('progressStatus', ''), '青'),
+                "全配達": progress.get('totalDeliveries', 0),
+                "完了配達": progress.get('completedDeliveries', 0),
+                "状態": "ログアウト" if itinerary.get('sessionEndTime') else "",
+                "会社": company_info.get('companyName')
+            })
+        return pd.DataFrame(rows)
+
+    random.seed(0)
+    payload = make_payload()
+
+    expected = parse_linear(payload)[SUMMARY_COLUMNS]
+    pd.testing.assert_frame_equal(parse_summaries(payload), expected, check_dtype=False)
+
+    linear = min(timeit.repeat(lambda: parse_linear(payload), number=1, repeat=3))
+    indexed = min(timeit.repeat(lambda: parse_summaries(payload), number=1, repeat=3))
+    print(f"itineraries: {len(payload['itinerarySummaries'])}")
+    print(f"linear scan : {linear * 1000:8.1f} ms")
+    print(f"indexed     : {indexed * 1000:8.1f} ms  ({linear / indexed:.0f}x)")
+
+    # 電話番号の整形: 10万行で旧実装（3回の apply）と比較
+    def normalize_phones_apply(phones):
+        phones = phones.str.replace('+81', '0', regex=False)
+        phones = phones.apply(lambda x: ''.join(filter(str.isdigit, str(x))))
+        return phones.apply(lambda x: f"{x[:3]}-{x[3:7]}-{x[7:]}" if len(x) == 11 else x)
+
+    formats = ['+8190{:08d}', '+81 90-{:04d}-{:04d}', '080{:08d}', '{:05d}', '']
+    phones = pd.Series([
+        formats[i % len(formats)].format(*([i % 10 ** 8] if formats[i % len(formats)].count('{') == 1 else [i % 10 ** 4, i % 10 ** 4]))
+        for i in range(100_000)
+    ])
+    phones[::97] = None
+    pd.testing.assert_series_equal(normalize_phones(phones), normalize_phones_apply(phones))
+
+    by_apply = min(timeit.repeat(lambda: normalize_phones_apply(phones), number=1, repeat=3))
+    vectorised = min(timeit.repeat(lambda: normalize_phones(phones), number=1, repeat=3))
+    print(f"phones      : {len(phones)} rows")
+    print(f"apply x3    : {by_apply * 1000:8.1f} ms")
+    print(f"str methods : {vectorised * 1000:8.1f} ms  ({by_apply / vectorised:.1f}x)")
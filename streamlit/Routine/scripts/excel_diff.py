@@ -0,0 +1,403 @@
+"""Excel/CSV 比較エンジン
+
+セル毎に df.iloc[idx][col] を読むのではなく、列単位でNumPy配列に揃えて
+NaNを考慮した不一致マスクを一度に計算し、差分のあるセルだけを結果にする。
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from itertools import islice, zip_longest
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+from openpyxl.utils import get_column_letter, column_index_from_string
+
+from scripts.sheet_visibility import get_cell_visibility_info
+
+# (DataFrame, 非表示行・列, 列名→Excel列記号)
+SheetData = Tuple[pd.DataFrame, Optional[Dict[str, Set[int]]], Dict[str, str]]
+
+# これ未満のセル数なら子プロセスへの受け渡しの方が高くつくので直列で比較
+PARALLEL_MIN_CELLS = 200_000
+
+RESULT_COLUMNS = ['シート名', 'セル', '行', '列', 'ファイル1の値', 'ファイル2の値', '表示状態']
+DEFAULT_CHUNK_ROWS = 50_000
+
+
+def column_mapping_for(df: pd.DataFrame) -> Dict[str, str]:
+    """列名 → Excelの列記号"""
+    return {str(col): get_column_letter(i + 1) for i, col in enumerate(df.columns)}
+
+
+def load_excel_sheets(file) -> Dict[str, SheetData]:
+    """ワークブックを1回だけ解析し、全シートの値と表示状態を取り出す
+
+    pd.ExcelFile・load_workbook・シート毎の read_excel で3回解析していたのを、
+    openpyxlで読み込んだブックを pandas にそのまま渡して1回にする。
+    （read_only モードでは行・列の非表示情報が読めないため通常モードで読む）
+    """
+    wb = load_workbook(file, data_only=True)
+    try:
+        frames = pd.read_excel(wb, sheet_name=None, engine='openpyxl')
+        return {
+            str(sheet_name): (df, get_cell_visibility_info(wb[sheet_name]), column_mapping_for(df))
+            for sheet_name, df in frames.items()
+        }
+    finally:
+        wb.close()
+
+
+def _column_values(df: pd.DataFrame, col) -> np.ndarray:
+    """列の値の配列（日付・時間の列は np.datetime64 ではなく pd.Timestamp / pd.Timedelta）"""
+    series = df[col]
+    if series.dtype.kind in 'mM':
+        return series.astype(object).to_numpy()
+    return series.to_numpy()
+
+
+def _aligned_values(df: pd.DataFrame, col, max_rows: int) -> np.ndarray:
+    """列を max_rows 行の配列にする（無い列・不足行はNaN）"""
+    values = _column_values(df, col) if col in df.columns else np.empty(0, dtype=object)
+    if len(values) == max_rows:
+        return values
+    padded = np.full(max_rows, np.nan, dtype=object)
+    padded[:len(values)] = values
+    return padded
+
+
+def not_equal_mask(values1: np.ndarray, values2: np.ndarray) -> np.ndarray:
+    """NaN同士は一致とみなす不一致マスク"""
+    na1 = pd.isna(values1)
+    na2 = pd.isna(values2)
+    mask = na1 != na2
+    both = ~(na1 | na2)
+    if both.any():
+        left, right = values1[both], values2[both]
+        try:
+            neq = np.asarray(left != right, dtype=bool)
+            if neq.shape != left.shape:
+                raise TypeError
+        except (TypeError, ValueError):
+            # 型が揃わない列（日付と文字列など）は要素毎に比較
+            neq = np.fromiter((a != b for a, b in zip(left, right)), dtype=bool, count=len(left))
+        mask[both] = neq
+    return mask
+
+
+def visibility_status(row_num: int, col_idx: Optional[int], visibility_info: Optional[Dict]) -> str:
+    if not visibility_info:
+        return "表示"
+    status = ""
+    if row_num in visibility_info['hidden_rows']:
+        status += "行: 非表示 "
+    if col_idx is not None and col_idx in visibility_info['hidden_cols']:
+        status += "列: 非表示"
+    return status.strip() or "表示"
+
+
+def compare_dataframes(
+    df1: pd.DataFrame,
+    df2: pd.DataFrame,
+    sheet_name: str,
+    visibility_info1: Optional[Dict] = None,
+    visibility_info2: Optional[Dict] = None,
+    column_mapping1: Optional[Dict[str, str]] = None,
+    column_mapping2: Optional[Dict[str, str]] = None,
+    row_offset: int = 0
+) -> List[Dict[str, Any]]:
+    """2つのDataFrameを比較して違いを見つける（位置ベース）
+
+    row_offset はチャンク比較時の先頭行の位置（行番号に加算する）。
+    """
+    differences = []
+
+    # 列はファイル1の順、ファイル2にしか無い列はその後ろ
+    all_columns = list(df1.columns) + [col for col in df2.columns if col not in df1.columns]
+    max_rows = max(len(df1), len(df2))
+
+    for col_pos, col in enumerate(all_columns):
+        values1 = _aligned_values(df1, col, max_rows)
+        values2 = _aligned_values(df2, col, max_rows)
+        rows = np.flatnonzero(not_equal_mask(values1, values2))
+        if len(rows) == 0:
+            continue
+
+        # 列のExcel形式の参照を取得
+        excel_col1 = column_mapping1.get(str(col), '') if column_mapping1 else get_column_letter(col_pos + 1)
+        col_idx = column_index_from_string(excel_col1) if excel_col1 else None
+
+        for idx in rows.tolist():
+            row_num = idx + 1 + row_offset
+            differences.append({
+                'シート名': sheet_name,
+                'セル': f"{excel_col1}{row_num}",
+                '行': row_num,
+                '列': col,
+                'ファイル1の値': values1[idx],
+                'ファイル2の値': values2[idx],
+                '表示状態': visibility_status(row_num, col_idx, visibility_info1)
+            })
+
+    return differences
+
+
+def _canonical_cell(value) -> Optional[str]:
+    """行ハッシュ用のセルの値（数値は float の repr、空は None、それ以外は str）"""
+    if isinstance(value, (bool, np.bool_)):
+        return str(value)
+    if isinstance(value, (int, float, np.number)):
+        return None if value != value else repr(float(value))
+    if value is None or value is pd.NaT:
+        return None
+    return str(value)
+
+
+def _hash_values(series: pd.Series) -> pd.Series:
+    """行ハッシュ用に列の値を dtype に依らない文字列へそろえる
+
+    空のセルがあると整数の列は float 列に、文字列のセル（'N/A' など）があると
+    数値の列は object 列になる。dtype 毎に違う方法でハッシュすると
+    ファイル間で全行のハッシュが変わるため、全ての列を同じ関数でそろえる。
+    """
+    if series.dtype.kind in 'iuf':
+        # 数値の列は _canonical_cell と同じ値を Python の float から直接作る（高速化のみ）
+        values = [repr(v) if v == v else None for v in series.to_numpy(dtype='float64', na_value=np.nan).tolist()]
+        return pd.Series(values, index=series.index, dtype=object)
+    return series.astype(object).map(_canonical_cell)
+
+
+def _row_keys(df: pd.DataFrame, columns: List, key_columns: Optional[List[str]], row_name: str) -> pd.DataFrame:
+    """結合キー（キー列 or 行内容のハッシュ）+ 同じキー内の出現順 + 元の行位置"""
+    if key_columns:
+        keys = df[key_columns].reset_index(drop=True)
+    else:
+        frame = df.reindex(columns=columns)
+        normalized = pd.DataFrame({i: _hash_values(frame.iloc[:, i]) for i in range(frame.shape[1])})
+        hashed = pd.util.hash_pandas_object(normalized, index=False)
+        keys = pd.DataFrame({'_hash': hashed.to_numpy()})
+    # キーが重複する行は出現順で対応付ける
+    keys['_occurrence'] = keys.groupby(list(keys.columns), dropna=False).cumcount()
+    keys[row_name] = np.arange(len(df))
+    return keys
+
+
+def _row_summary(df: pd.DataFrame, row: int) -> str:
+    return ' | '.join(f"{col}={value}" for col, value in df.iloc[row].items() if not pd.isna(value))
+
+
+def compare_by_key(
+    df1: pd.DataFrame,
+    df2: pd.DataFrame,
+    sheet_name: str,
+    visibility_info1: Optional[Dict] = None,
+    visibility_info2: Optional[Dict] = None,
+    column_mapping1: Optional[Dict[str, str]] = None,
+    column_mapping2: Optional[Dict[str, str]] = None,
+    key_columns: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """キー列（未指定なら行内容のハッシュ）で行を対応付けて比較する
+
+    行の挿入・削除があっても以降の行がずれないので、差分は実際の変更数に比例する。
+    結果は 差分種別（削除/追加/変更）付きで、削除・追加は1行1件、変更はセル毎。
+    行内容のハッシュで対応付けた場合（キー列が無いシートも同様）、
+    変更された行は削除+追加として現れる。
+    """
+    all_columns = list(df1.columns) + [col for col in df2.columns if col not in df1.columns]
+    if key_columns and any(col not in df1.columns or col not in df2.columns for col in key_columns):
+        # キー列が無いシートは行内容のハッシュで対応付ける
+        key_columns = None
+
+    keys1 = _row_keys(df1, all_columns, key_columns, '_row1')
+    keys2 = _row_keys(df2, all_columns, key_columns, '_row2')
+    join_columns = [col for col in keys1.columns if col != '_row1']
+    merged = keys1.merge(keys2, on=join_columns, how='outer', indicator=True)
+
+    differences = []
+    for kind, df, row_name, visibility_info, value_key in (
+        ('削除', df1, '_row1', visibility_info1, 'ファイル1の値'),
+        ('追加', df2, '_row2', visibility_info2, 'ファイル2の値'),
+    ):
+        side = 'left_only' if kind == '削除' else 'right_only'
+        rows = np.sort(merged.loc[merged['_merge'] == side, row_name].to_numpy(dtype=np.int64))
+        for row in rows.tolist():
+            row_num = row + 1
+            differences.append({
+                '差分種別': kind,
+                'シート名': sheet_name,
+                'セル': f"{row_num}:{row_num}",
+                '行': row_num,
+                '列': '',
+                'ファイル1の値': None,
+                'ファイル2の値': None,
+                value_key: _row_summary(df, row),
+                '表示状態': visibility_status(row_num, None, visibility_info)
+            })
+
+    matched = merged[merged['_merge'] == 'both'].sort_values('_row1')
+    rows1 = matched['_row1'].to_numpy(dtype=np.int64)
+    rows2 = matched['_row2'].to_numpy(dtype=np.int64)
+
+    changes = []
+    for col_pos, col in enumerate(all_columns):
+        values1 = _column_values(df1, col)[rows1] if col in df1.columns else np.full(len(rows1), np.nan, dtype=object)
+        values2 = _column_values(df2, col)[rows2] if col in df2.columns else np.full(len(rows2), np.nan, dtype=object)
+        positions = np.flatnonzero(not_equal_mask(values1, values2))
+        if len(positions) == 0:
+            continue
+
+        excel_col1 = column_mapping1.get(str(col), '') if column_mapping1 else get_column_letter(col_pos + 1)
+        col_idx = column_index_from_string(excel_col1) if excel_col1 else None
+        for pos in positions.tolist():
+            row_num = int(rows1[pos]) + 1
+            changes.append({
+                '差分種別': '変更',
+                'シート名': sheet_name,
+                'セル': f"{excel_col1}{row_num}",
+                '行': row_num,
+                '列': col,
+                'ファイル1の値': values1[pos],
+                'ファイル2の値': values2[pos],
+                '表示状態': visibility_status(row_num, col_idx, visibility_info1)
+            })
+
+    # 変更はファイル1の行順・列順に並べる
+    changes.sort(key=lambda diff: diff['行'])
+    return differences + changes
+
+
+def compare_sheets(
+    sheets1: Dict[str, SheetData],
+    sheets2: Dict[str, SheetData],
+    sheet_names: List[str],
+    max_workers: Optional[int] = None,
+    progress_callback: Optional[Callable[[int, int, str], None]] = None,
+    by_key: bool = False,
+    key_columns: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """共通シートを比較（大きいブックはプロセスプールで並列）
+
+    結果は sheet_names の順に並べて返す。progress_callback(完了数, 全体, シート名)
+    by_key=True の場合は compare_by_key で行を対応付けて比較する。
+    """
+    total = len(sheet_names)
+    compare = partial(compare_by_key, key_columns=key_columns) if by_key else compare_dataframes
+    results: Dict[str, List[Dict[str, Any]]] = {}
+
+    def args_for(sheet_name):
+        df1, visibility_info1, column_mapping1 = sheets1[sheet_name]
+        df2, visibility_info2, column_mapping2 = sheets2[sheet_name]
+        return (df1, df2, sheet_name, visibility_info1, visibility_info2, column_mapping1, column_mapping2)
+
+    cells = sum(sheets1[name][0].size + sheets2[name][0].size for name in sheet_names)
+    if total <= 1 or cells < PARALLEL_MIN_CELLS:
+        for i, sheet_name in enumerate(sheet_names, start=1):
+            results[sheet_name] = compare(*args_for(sheet_name))
+            if progress_callback:
+                progress_callback(i, total, sheet_name)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(compare, *args_for(name)): name for name in sheet_names}
+            for i, future in enumerate(as_completed(futures), start=1):
+                sheet_name = futures[future]
+                results[sheet_name] = future.result()
+                if progress_callback:
+                    progress_callback(i, total, sheet_name)
+
+    return [diff for sheet_name in sheet_names for diff in results[sheet_name]]
+
+
+def iter_csv_chunks(file, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """CSVを chunk_rows 行ずつ読む"""
+    yield from pd.read_csv(file, chunksize=chunk_rows)
+
+
+def _header_names(header) -> List[str]:
+    """pd.read_excel と同じ列名（空の見出しは 'Unnamed: n'、重複は 'col', 'col.1', ...）"""
+    names = [str(name) if name not in (None, '') else f'Unnamed: {i}' for i, name in enumerate(header)]
+    unnamed = [i for i, name in enumerate(header) if name in (None, '')]
+    # read_excel（PythonParser）と同じく、見出しのある列を先に、既存の列名を避けて番号を振る
+    counts: Dict[str, int] = {}
+    for i in [i for i in range(len(names)) if i not in unnamed] + unnamed:
+        name = old_name = names[i]
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[old_name] = count + 1
+            name = f"{old_name}.{count}"
+            count = count + 1 if name in names else counts.get(name, 0)
+        names[i] = name
+        counts[name] = count + 1
+    return names
+
+
+def iter_excel_chunks(ws, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """read_only のワークシートを iter_rows で chunk_rows 行ずつ読む（1行目は見出し）"""
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = _header_names(header)
+    width = len(columns)
+    while True:
+        # 行の長さが見出しと違う場合は切り詰め・補完して揃える
+        chunk = [tuple(row[:width]) + (None,) * (width - len(row)) for row in islice(rows, chunk_rows)]
+        if not chunk:
+            return
+        yield pd.DataFrame(chunk, columns=columns)
+
+
+class DiffWriter:
+    """差分を結果ブックへ逐次書き込む（write_only モードで行をメモリに溜めない）"""
+
+    def __init__(self, output_path, preview_rows: int = 1000):
+        self.output_path = output_path
+        self.preview_rows = preview_rows
+        self.preview: List[Dict[str, Any]] = []
+        self.count = 0
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet()
+        self._ws.append(RESULT_COLUMNS)
+
+    @staticmethod
+    def _cell_value(value):
+        if value is None or (not isinstance(value, (list, tuple)) and pd.isna(value)):
+            return None
+        if isinstance(value, (pd.Timestamp, np.datetime64)):
+            return pd.Timestamp(value).to_pydatetime()
+        if isinstance(value, (pd.Timedelta, np.timedelta64)):
+            return pd.Timedelta(value).to_pytimedelta()
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+
+    def write(self, differences: List[Dict[str, Any]]) -> None:
+        for diff in differences:
+            self._ws.append([self._cell_value(diff[col]) for col in RESULT_COLUMNS])
+        if len(self.preview) < self.preview_rows:
+            self.preview.extend(differences[:self.preview_rows - len(self.preview)])
+        self.count += len(differences)
+
+    def close(self) -> None:
+        self._wb.save(self.output_path)
+
+
+def stream_compare(
+    chunks1: Iterator[pd.DataFrame],
+    chunks2: Iterator[pd.DataFrame],
+    sheet_name: str,
+    writer: DiffWriter
+) -> None:
+    """チャンク同士を位置順に比較し、差分をそのまま writer に書き出す"""
+    row_offset = 0
+    for chunk1, chunk2 in zip_longest(chunks1, chunks2):
+        # 片方が先に終わった場合は空のチャンクと比較（残りは全て差分）
+        if chunk1 is None:
+            chunk1 = pd.DataFrame(columns=chunk2.columns)
+        if chunk2 is None:
+            chunk2 = pd.DataFrame(columns=chunk1.columns)
+        writer.write(compare_dataframes(
+            chunk1, chunk2, sheet_name,
+            column_mapping1=column_mapping_for(chunk1),
+            row_offset=row_offset
+        ))
+        row_offset += max(len(chunk1), len(chunk2))
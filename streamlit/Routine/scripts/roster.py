@@ -0,0 +1,99 @@
+"""Roster（rosterview の cspDATable）の取得
+
+行毎・セル毎に find_elements / .text を呼ぶと、1回毎にWebDriverとの往復になり
+300行で数千回の呼び出しになる。ここではテーブル全体をJavaScript1回で
+セル文字列の2次元配列として読み、固定の sleep の代わりに
+「ページ読み込み完了・テーブル表示・データ行あり」になるまで待つ。
+"""
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+from scripts.cortex import MIDWAY_URL, MidwayAuthError
+
+logger = logging.getLogger(__name__)
+
+ROSTER_URL = "https://logistics.amazon.co.jp/internal/capacity/rosterview?serviceAreaId={service_area_id}&date={date}"
+TABLE_ID = 'cspDATable'
+MIN_CELLS = 7
+
+# 読み込み完了前・テーブル非表示なら null、表示済みなら見出し行以外の td の文字列
+TABLE_ROWS_SCRIPT = f"""
+if (document.readyState !== 'complete') return null;
+const table = document.getElementById('{TABLE_ID}');
+if (!table || !table.getClientRects().length) return null;
+return Array.from(table.querySelectorAll('tr')).slice(1).map(
+    row => Array.from(row.querySelectorAll('td'), cell => cell.innerText.trim())
+);
+"""
+
+
+def roster_url(service_area_id: str, date: Optional[str] = None) -> str:
+    return ROSTER_URL.format(service_area_id=service_area_id, date=date or datetime.now().strftime('%Y-%m-%d'))
+
+
+def roster_records(rows: List[List[str]]) -> List[Dict[str, str]]:
+    """セル文字列の行から従来と同じ列のレコードを作る（セルが7未満・全て空の行は除く）"""
+    records = []
+    for cols in rows:
+        if len(cols) < MIN_CELLS:
+            continue
+        data = {
+            "DP ID": cols[0],
+            "DP名": cols[1],
+            "ステータス": cols[2],
+            "サービスタイプ": cols[3],
+            "開始時刻": cols[5],
+            "終了時間": cols[6],
+            "サイクル": cols[-1]
+        }
+        if any(data.values()):
+            records.append(data)
+    return records
+
+
+def _table_rows(driver) -> Optional[List[List[str]]]:
+    return driver.execute_script(TABLE_ROWS_SCRIPT)
+
+
+def _populated_rows(driver) -> Optional[List[List[str]]]:
+    """データ行が描画されていれば行を返す（WebDriverWait の条件）"""
+    rows = _table_rows(driver)
+    return rows if rows and any(len(cols) >= MIN_CELLS for cols in rows) else None
+
+
+def fetch_roster(
+    driver,
+    url: str,
+    timeout: float = 30,
+    populate_timeout: float = 10,
+    max_retries: int = 3,
+) -> List[Dict[str, str]]:
+    """Rosterページを開き、テーブルにデータ行が出たら1回で読み取る
+
+    テーブルが timeout 内に表示されない、または表示後 populate_timeout 内に
+    データ行が出ない場合はページを再読み込みして max_retries 回まで試す。
+    テーブルは出たがデータ行が無いままなら空のリスト（当日のRosterが0件）、
+    テーブル自体が一度も出なければ TimeoutException。
+    Midwayのログイン画面へリダイレクトされた場合は再試行せず MidwayAuthError。
+    """
+    driver.get(url)
+    table_shown = False
+    for attempt in range(max_retries):
+        try:
+            WebDriverWait(driver, timeout, poll_frequency=0.25).until(lambda d: _table_rows(d) is not None)
+            table_shown = True
+            rows = WebDriverWait(driver, populate_timeout, poll_frequency=0.25).until(_populated_rows)
+            return roster_records(rows)
+        except TimeoutException:
+            if MIDWAY_URL in (driver.current_url or ''):
+                raise MidwayAuthError("Midway認証が必要です")
+            logger.warning(f"{url}: テーブルにデータがありません (試行 {attempt + 1}/{max_retries})")
+            if attempt < max_retries - 1:
+                driver.refresh()
+    if not table_shown:
+        raise TimeoutException(f"{TABLE_ID} が表示されませんでした")
+    return []
@@ -0,0 +1,240 @@
+"""Routine Board（Tool_Routine Board.xlsm）の取り込み
+
+SharePointへは前回の ETag / Last-Modified を付けた条件付きGETを送り、304（変更なし）なら
+ダウンロードも解析もしない。変更があった場合だけ xlsm をメモリ上で解析し、
+ルーティン列と時刻列を文字列型に揃えたParquetスナップショットとして保存する。
+ページはスナップショットを更新日時キーのメモリキャッシュから読む。
+"""
+import json
+import re
+import threading
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from scripts.sharepoint import get_client
+
+ROUTINE_BOARD_URL = "https://share.amazon.com/sites/COJP_ORM/Shared%20Documents/02_Tool/Routine%20Board/Tool_Routine%20Board.xlsm"
+SHEET_NAME = 'Routine Board'
+HEADER_ROW = 1
+TIME_COLUMN = 'Unnamed: 2'
+# ルーティン列以外（時刻列は TIME_COLUMN として別に残す）
+EXCLUDED_PREFIXES = ('Unnamed', 'Ver', 'Time')
+
+DATA_DIR = Path('data')
+SNAPSHOT_PATH = DATA_DIR / 'Routine_Board.parquet'
+META_PATH = DATA_DIR / 'Routine_Board.json'
+
+# Lunch/Break は所要時間分（15分 = 1行）下の行も同じ表示にする
+BREAK_PATTERN = r'Lunch|Break'
+SLOT_HOURS = 0.25
+MAX_BREAK_HOURS = 2
+
+_cache: Dict[str, Tuple[int, pd.DataFrame]] = {}
+_cache_lock = threading.Lock()
+# 個別表示: Chime挨拶の行の先頭（・の前）が担当Node、'ABC1,2' は 'ABC1','ABC2' に展開
+CHIME_MARKER = '・Chime挨拶'
+NODE_PATTERN = re.compile(r'\w+(?:,\w+)*')
+BREAK_RE = re.compile(BREAK_PATTERN)
+# '13A' のような時刻の代わりのNode見出し
+NODE_HEADING_RE = re.compile(r'1[34][^\W\d_]')
+
+# (スナップショットのパス, 種類) → (元のボード, 派生データ)
+_derived: Dict[Tuple[str, str], Tuple[pd.DataFrame, Any]] = {}
+
+
+def _to_text(value) -> Optional[str]:
+    """セル値を文字列に揃える（時刻は 'HH:MM:SS'、空 → None。従来のCSV経由と同じ表記）"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return str(value)
+
+
+def parse_routine_board(content: bytes) -> pd.DataFrame:
+    """xlsm のバイト列からスナップショット（時刻列 + ルーティン列、全て文字列）を作る"""
+    df = pd.read_excel(BytesIO(content), sheet_name=SHEET_NAME, header=HEADER_ROW)
+    routines = [col for col in df.columns if not str(col).startswith(EXCLUDED_PREFIXES)]
+    board = df[[TIME_COLUMN] + routines]
+    # 値は str / None のみ（Parquetでは文字列型の列になる）
+    return pd.DataFrame({col: [_to_text(v) for v in board[col]] for col in board.columns}, dtype=object)
+
+
+def read_meta() -> dict:
+    try:
+        with open(META_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(meta: dict) -> None:
+    temp_path = META_PATH.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    temp_path.replace(META_PATH)
+
+
+def refresh_routine_board(url: str = ROUTINE_BOARD_URL) -> bool:
+    """SharePoint上で変更があった時だけスナップショットを作り直す（作り直したら True）"""
+    meta = read_meta()
+    headers = {}
+    if SNAPSHOT_PATH.exists():
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    response = get_client().get(url, headers=headers)
+    checked_at = datetime.now().isoformat(timespec='seconds')
+    if response.status_code == 304:
+        meta['checked_at'] = checked_at
+        _write_meta(meta)
+        return False
+    response.raise_for_status()
+
+    board = parse_routine_board(response.content)
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    temp_path = SNAPSHOT_PATH.with_suffix('.tmp')
+    board.to_parquet(temp_path, index=False)
+    temp_path.replace(SNAPSHOT_PATH)
+    _write_meta({
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'checked_at': checked_at,
+    })
+    return True
+
+
+def checked_at() -> Optional[datetime]:
+    """最後にSharePointと照合した日時（未取得なら None）"""
+    value = read_meta().get('checked_at')
+    return datetime.fromisoformat(value) if value and SNAPSHOT_PATH.exists() else None
+
+
+def load_routine_board() -> pd.DataFrame:
+    """スナップショットを返す（更新日時が同じならメモリから）"""
+    mtime_ns = SNAPSHOT_PATH.stat().st_mtime_ns
+    key = str(SNAPSHOT_PATH.resolve())
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+        board = pd.read_parquet(SNAPSHOT_PATH)
+        _cache[key] = (mtime_ns, board)
+        return board
+
+
+def routine_columns(board: pd.DataFrame) -> pd.DataFrame:
+    return board.loc[:, ~board.columns.str.startswith(EXCLUDED_PREFIXES)]
+
+
+def time_labels(board: pd.DataFrame) -> pd.Series:
+    """時刻列を 'HH:MM' に揃える（” は上の時刻を引き継ぎ、3文字以下は空欄）"""
+    times = board[TIME_COLUMN].replace('”', None).ffill()
+    labels = times.str[:5].fillna('')
+    return labels.where(labels.str.strip().str.len() > 3, '')
+
+
+def expand_breaks(routines: pd.DataFrame) -> pd.DataFrame:
+    """Lunch/Break のセルの下、所要時間分の行を 'Lunch'/'Break' で上書きする
+
+    開始セルの判定・時間の抽出は全セルまとめて行い、埋める行は開始行 + 1〜span を
+    np.repeat で展開して一括代入する。範囲が重なる場合は下の開始セルが優先（従来と同じ）。
+    """
+    # 時刻の索引は重複するため、位置（行番号・列番号）で扱う
+    values = routines.to_numpy(dtype=object).copy()
+    # stack() で空セルを落とし、文字の入ったセルだけを検索する
+    stacked = pd.DataFrame(values).stack()
+    stacked = stacked[stacked.to_numpy() != '']
+    breaks = stacked[stacked.str.contains(BREAK_PATTERN, na=False)]
+    breaks = breaks.str.replace('15min', '0.25h', regex=False).str.replace('30min', '0.5h', regex=False)
+    hours = breaks.str.extract(r'(\d+(?:\.\d+)?)', expand=False).astype(float)
+    spans = ((hours / SLOT_HOURS).where(hours <= MAX_BREAK_HOURS).dropna().astype(int) - 1)
+    spans = spans[spans > 0].sort_index(level=[1, 0])  # 列毎に上から
+    if spans.empty:
+        return routines.copy()
+
+    counts = spans.to_numpy()
+    starts = spans.index.get_level_values(0).to_numpy()
+    cols = spans.index.get_level_values(1).to_numpy()
+    labels = breaks[spans.index].str.split('_').str[0].to_numpy(dtype=object)
+
+    offsets = np.arange(counts.sum()) - np.repeat(counts.cumsum() - counts, counts) + 1
+    rows = np.repeat(starts, counts) + offsets
+    inside = rows < len(values)
+    # 同じセルへの代入は後の（下の開始セルの）値が残る
+    values[rows[inside], np.repeat(cols, counts)[inside]] = np.repeat(labels, counts)[inside]
+    return pd.DataFrame(values, index=routines.index, columns=routines.columns)
+
+
+def overview_table(board: pd.DataFrame) -> pd.DataFrame:
+    """全体表示用の表（行: 時刻、列: Routine、Lunch/Break展開済み）"""
+    table = routine_columns(board).copy()
+    table.index = pd.Index(time_labels(board))
+    table = table.replace({None: '', 'None': ''})
+    return expand_breaks(table)
+
+
+def _node_list(contents: List[str]) -> List[str]:
+    """Chime挨拶の行から担当Nodeの一覧を作る（カンマ区切りを先に、単独のNodeを後に）"""
+    texts = [content.split('・')[0] for content in contents if CHIME_MARKER in content]
+    raw_nodes = NODE_PATTERN.findall(' '.join(texts))
+    flattened = []
+    for entry in (n for n in raw_nodes if ',' in n):
+        parts = entry.split(',')
+        prefix = parts[0][:3]
+        flattened.extend([parts[0]] + [prefix + p for p in parts[1:]])
+    return flattened + [n for n in raw_nodes if ',' not in n]
+
+
+def routine_plan(routine: str, contents: pd.Series, times: pd.Series) -> dict:
+    """1つのRoutineの表示内容
+
+    tasks は (時刻 'HH:MM', 内容, 種類, チェックボックスのキー) のリスト。
+    種類は 'node'（時刻なし・Node見出し）/ 'break'（Lunch・Break）/ 'task'。
+    """
+    tasks = []
+    counter = 0
+    for content, time in zip(contents, times.reindex(contents.index)):
+        heading = time is not None and NODE_HEADING_RE.fullmatch(time.strip())
+        if time is None or heading:
+            tasks.append(('', content, 'node', None))
+        elif BREAK_RE.search(content):
+            tasks.append((time[:5], content, 'break', None))
+        else:
+            counter += 1
+            tasks.append((time[:5], content, 'task', f"{routine}_{counter}_{time.replace(':', '_')}"))
+    return {'tasks': tasks, 'nodes': _node_list(list(contents))}
+
+
+def routine_plans(board: pd.DataFrame) -> Dict[str, dict]:
+    """全てのRoutineの表示内容（Routine名 → routine_plan）"""
+    times = board[TIME_COLUMN].replace('”', None).ffill()
+    times = times.astype(object).where(times.notna(), None)
+    routines = routine_columns(board)
+    return {
+        routine: routine_plan(routine, routines[routine].dropna().astype(str), times)
+        for routine in routines.columns
+    }
+
+
+def _cached(name: str, board: pd.DataFrame, build: Callable[[pd.DataFrame], Any]) -> Any:
+    """スナップショットが変わった時だけ作り直す"""
+    key = (str(SNAPSHOT_PATH.resolve()), name)
+    with _cache_lock:
+        cached = _derived.get(key)
+        if cached is None or cached[0] is not board:
+            cached = _derived[key] = (board, build(board))
+        return cached[1]
+
+
+def get_overview(board: pd.DataFrame) -> pd.DataFrame:
+    return _cached('overview', board, overview_table)
+
+
+def get_routine_plans(board: pd.DataFrame) -> Dict[str, dict]:
+    return _cached('plans', board, routine_plans)
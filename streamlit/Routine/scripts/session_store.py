@@ -0,0 +1,125 @@
+"""ページの状態（チェックボックス・選択中のRoutine・色）を保存するSQLiteストア
+
+状態はメモリ上の辞書で持ち、変更されたキーだけを覚えておく。書き込みはデバウンス用の
+タイマーで遅らせ、まとめて1回の executemany・1トランザクションで行う。
+接続はWALモードで開いたものをプロセス内で使い回す。
+"""
+import atexit
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Set
+
+DEFAULT_DEBOUNCE_SECONDS = 0.5
+
+
+def _decode(value: str, is_json: bool) -> Any:
+    """保存した値を戻す
+
+    旧形式（str(value) で保存した行）は 'True'/'False' だけを bool に戻し、それ以外は
+    文字列のまま返す（'123' や 'null' を JSON として読むと型が変わってしまう）。
+    """
+    if is_json:
+        return json.loads(value)
+    return {'True': True, 'False': False}.get(value, value)
+
+
+class SessionStore:
+    def __init__(self, db_path, debounce: float = DEFAULT_DEBOUNCE_SECONDS):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.debounce = debounce
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+        self._dirty: Set[str] = set()
+
+        # Streamlitの再実行は別スレッドで動くため、接続はロックで守って共有する
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS session_data
+            (key TEXT PRIMARY KEY, value TEXT, is_json INTEGER NOT NULL DEFAULT 0)
+        ''')
+        # 旧形式のテーブルには JSON で保存したかどうかの列を追加（既存の行は旧形式）
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(session_data)')]
+        if 'is_json' not in columns:
+            self._conn.execute('ALTER TABLE session_data ADD COLUMN is_json INTEGER NOT NULL DEFAULT 0')
+        self._conn.commit()
+        self._state: Dict[str, Any] = {
+            key: _decode(value, bool(is_json))
+            for key, value, is_json in self._conn.execute('SELECT key, value, is_json FROM session_data')
+        }
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            return self._state.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        """値が変わった時だけ書き込み対象にする"""
+        self.update({key: value})
+
+    def update(self, values: Dict[str, Any]) -> None:
+        with self._lock:
+            changed = [key for key, value in values.items() if self._state.get(key, object()) != value]
+            if not changed:
+                return
+            for key in changed:
+                self._state[key] = values[key]
+            self._dirty.update(changed)
+            self._schedule_flush()
+
+    def clear(self, keep: Iterable[str] = ()) -> None:
+        """keep 以外のキーを削除（削除は即時に反映）"""
+        keep = set(keep)
+        with self._lock:
+            self._state = {key: value for key, value in self._state.items() if key in keep}
+            self._dirty &= keep
+            with self._conn:
+                self._conn.execute(
+                    f"DELETE FROM session_data WHERE key NOT IN ({','.join('?' * len(keep))})", tuple(keep)
+                )
+
+    def _schedule_flush(self) -> None:
+        # 連続した変更はタイマーを張り直して1回の書き込みにまとめる
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.debounce, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self) -> int:
+        """変更されたキーを1トランザクションで書き込み、書いた件数を返す"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return 0
+            rows = [(key, json.dumps(self._state[key], ensure_ascii=False)) for key in self._dirty]
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO session_data (key, value, is_json) VALUES (?, ?, 1)', rows
+                )
+            self._dirty.clear()
+            return len(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+
+_stores: Dict[str, SessionStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_session_store(db_path) -> SessionStore:
+    """プロセス共通のストアを返す（終了時に未書き込みの変更を書き出す）"""
+    key = str(Path(db_path).resolve())
+    with _stores_lock:
+        if key not in _stores:
+            store = _stores[key] = SessionStore(db_path)
+            atexit.register(store.flush)
+        return _stores[key]
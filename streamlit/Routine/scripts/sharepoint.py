@@ -0,0 +1,316 @@
+"""SharePoint共通クライアント
+
+各ページで requests.Session と HttpNegotiateAuth を毎回作り直さず、
+プロセス内で1つのセッション（コネクションプール・Negotiate認証）を使い回す。
+※ flet/SP_sest・就業実績/scripts からも sys.path 経由でこのファイルを読み込む（コピーは置かない）
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests_negotiate_sspi import HttpNegotiateAuth
+import urllib3
+from urllib3.util.retry import Retry
+
+# SSL証明書の警告を無視
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+logger = logging.getLogger(__name__)
+
+SHAREPOINT_BASE_URL = "https://share.amazon.com"
+DEFAULT_HEADERS = {
+    'Accept': 'application/json;odata=verbose',
+    'Content-Type': 'application/json;odata=verbose',
+    'User-Agent': 'Python NTLM Client'
+}
+
+DEFAULT_CACHE_DIR = Path.home() / 'Documents' / 'sp_cache'
+DEFAULT_CACHE_BYTES = 500 * 1024 * 1024
+
+# hook(method, url, status_code, elapsed_seconds)
+TimingHook = Callable[[str, str, int, float], None]
+
+
+def log_timing(method: str, url: str, status_code: int, elapsed: float) -> None:
+    """デフォルトの計測フック（DEBUGログに出力）"""
+    logger.debug(f"{method} {url} -> {status_code} ({elapsed * 1000:.0f} ms)")
+
+
+class DownloadCache:
+    """ServerRelativeUrl をキーにしたダウンロードファイルのキャッシュ（サイズ上限付きLRU）"""
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.index_path = self.cache_dir / 'index.json'
+        self._lock = threading.Lock()
+        self._index: Dict[str, dict] = self._load_index()
+
+    def _load_index(self) -> Dict[str, dict]:
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self) -> None:
+        temp_path = self.index_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f, ensure_ascii=False)
+        temp_path.replace(self.index_path)
+
+    def _file_path(self, key: str) -> Path:
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return self.cache_dir / f"{digest}{Path(key).suffix}"
+
+    def lookup(self, key: str) -> Optional[dict]:
+        """キャッシュ済みのエントリ（ファイルが残っている場合のみ）"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry and self._file_path(key).exists():
+                return dict(entry)
+            return None
+
+    def touch(self, key: str) -> Path:
+        """LRU用に最終アクセス時刻を更新してパスを返す"""
+        with self._lock:
+            self._index[key]['last_access'] = time.time()
+            self._save_index()
+        return self._file_path(key)
+
+    def store(self, key: str, response: requests.Response, time_last_modified: Optional[str] = None) -> Path:
+        """レスポンス本体を保存し、検証用ヘッダーを記録"""
+        file_path = self._file_path(key)
+        temp_path = file_path.with_suffix(f"{file_path.suffix}.{threading.get_ident()}.part")
+        size = 0
+        with open(temp_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                if chunk:
+                    f.write(chunk)
+                    size += len(chunk)
+        temp_path.replace(file_path)
+
+        with self._lock:
+            self._index[key] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'time_last_modified': time_last_modified,
+                'size': size,
+                'last_access': time.time()
+            }
+            self._evict()
+            self._save_index()
+        return file_path
+
+    def _evict(self) -> None:
+        total = sum(entry['size'] for entry in self._index.values())
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]['last_access']):
+            if total <= self.max_bytes or len(self._index) <= 1:
+                break
+            try:
+                self._file_path(key).unlink()
+            except OSError:
+                pass
+            total -= entry['size']
+            del self._index[key]
+
+
+class SharePointClient:
+    def __init__(
+        self,
+        pool_size: int = 10,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        max_per_host: int = 4,
+        timeout: float = 30,
+        cache: Optional[DownloadCache] = None,
+    ):
+        self.timeout = timeout
+        self._cache = cache
+        self.max_per_host = max_per_host
+        self.timing_hooks: List[TimingHook] = [log_timing]
+        self._host_limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+        # Negotiate認証はセッションに1つだけ持たせ、keep-alive接続ごと再利用する
+        self.session = requests.Session()
+        self.session.auth = HttpNegotiateAuth()
+        self.session.verify = False
+        self.session.headers.update(DEFAULT_HEADERS)
+
+        # 一時的なエラー(429/5xx・接続断)のみ指数バックオフで再試行
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=max(pool_size, max_per_host),
+            max_retries=retry
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @property
+    def cache(self) -> DownloadCache:
+        with self._lock:
+            if self._cache is None:
+                self._cache = DownloadCache()
+            return self._cache
+
+    def add_timing_hook(self, hook: TimingHook) -> None:
+        self.timing_hooks.append(hook)
+
+    def _host_limit(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_limits[host]
+
+    def _fire_timing_hooks(self, method: str, url: str, status_code: int, elapsed: float) -> None:
+        for hook in self.timing_hooks:
+            try:
+                hook(method, url, status_code, elapsed)
+            except Exception as e:
+                logger.warning(f"Timing hook error: {e}")
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """ホスト毎の同時接続数を制限してリクエストを送信
+
+        stream=True の場合は本体を読み終えるか close() するまで枠を保持し、
+        計測も本体の転送を含めた時間にする（with でレスポンスを閉じること）。
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        limit = self._host_limit(url)
+        status_code = 0
+        released = False
+        limit.acquire()
+        start = time.perf_counter()
+
+        def finish() -> None:
+            nonlocal released
+            if released:
+                return
+            released = True
+            limit.release()
+            self._fire_timing_hooks(method, url, status_code, time.perf_counter() - start)
+
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except BaseException:
+            finish()
+            raise
+        status_code = response.status_code
+        if not kwargs.get('stream'):
+            finish()
+            return response
+
+        iter_content, close = response.iter_content, response.close
+
+        def iter_content_and_finish(*args, **kw):
+            try:
+                yield from iter_content(*args, **kw)
+            finally:
+                finish()
+
+        def close_and_finish():
+            try:
+                close()
+            finally:
+                finish()
+
+        response.iter_content = iter_content_and_finish
+        response.close = close_and_finish
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def get_json(self, url: str) -> List[dict]:
+        """OData(verbose)のAPIを呼び出し d.results を返す"""
+        response = self.get(url)
+        response.raise_for_status()
+        data = response.json().get('d', {})
+        return data.get('results', data)
+
+    def download(self, url: str, output_path: Path, chunk_size: int = 1024 * 1024) -> Path:
+        """ファイルをストリーミングで保存"""
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.get(url, stream=True) as response:
+            response.raise_for_status()
+            with open(output_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        f.write(chunk)
+        return output_path
+
+    def download_cached(self, url: str, key: Optional[str] = None, time_last_modified: Optional[str] = None) -> Path:
+        """条件付きGETでダウンロードし、キャッシュ上のパスを返す
+
+        key は ServerRelativeUrl（省略時はURLのパス）。一覧APIの TimeLastModified が
+        キャッシュと同じならリクエスト自体を省略し、304 の場合はローカルのコピーを返す。
+        """
+        key = key or urlparse(url).path
+        cache = self.cache
+        entry = cache.lookup(key)
+
+        if entry and time_last_modified and entry.get('time_last_modified') == time_last_modified:
+            return cache.touch(key)
+
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        with self.get(url, headers=headers, stream=True) as response:
+            if response.status_code != 304:
+                response.raise_for_status()
+                return cache.store(key, response, time_last_modified)
+            if cache.lookup(key):
+                return cache.touch(key)
+
+        # 304 なのにキャッシュの索引・ファイルが無い（削除・追い出し済み）場合は条件なしで取り直す
+        with self.get(url, stream=True) as response:
+            response.raise_for_status()
+            if response.status_code == 304:
+                raise requests.HTTPError(f"304 Not Modified without a cached copy: {url}", response=response)
+            return cache.store(key, response, time_last_modified)
+
+
+def folder_files_url(site: str, folder_path: str, select: Optional[str] = None) -> str:
+    """フォルダ内ファイル一覧APIのURL"""
+    url = f"{SHAREPOINT_BASE_URL}/{site}/_api/web/GetFolderByServerRelativeUrl('{folder_path}')/Files"
+    return f"{url}?$select={select}" if select else url
+
+
+def file_value_url(site: str, server_relative_url: str) -> str:
+    """ファイル本体取得APIのURL"""
+    return f"{SHAREPOINT_BASE_URL}/{site}/_api/web/GetFileByServerRelativeUrl('{server_relative_url}')/$value"
+
+
+_client: Optional[SharePointClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> SharePointClient:
+    """プロセス共通のクライアントを返す"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SharePointClient()
+        return _client
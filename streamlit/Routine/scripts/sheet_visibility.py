@@ -0,0 +1,28 @@
+"""ワークシートの非表示行・列の索引
+
+range(1, ws.max_row + 1) の全行について ws.row_dimensions[i] を参照すると、
+openpyxlは行毎にRowDimensionを生成してしまう（疎で max_row が大きいシートで重い）。
+ここでは既に存在する row_dimensions / column_dimensions だけを走査し、集合で返す。
+"""
+from typing import Dict, Set
+
+from openpyxl.utils import column_index_from_string
+
+
+def hidden_rows(ws) -> Set[int]:
+    return {idx for idx, dim in ws.row_dimensions.items() if dim.hidden}
+
+
+def hidden_cols(ws) -> Set[int]:
+    cols: Set[int] = set()
+    for key, dim in ws.column_dimensions.items():
+        if dim.hidden:
+            # 連続した列は1つのColumnDimension(min〜max)にまとめられている
+            start = dim.min or column_index_from_string(key)
+            cols.update(range(start, (dim.max or start) + 1))
+    return cols
+
+
+def get_cell_visibility_info(ws) -> Dict[str, Set[int]]:
+    """セルの表示/非表示情報を取得"""
+    return {'hidden_rows': hidden_rows(ws), 'hidden_cols': hidden_cols(ws)}
@@ -0,0 +1,102 @@
+"""シフト表（Shift_STCO.xlsx）の解析済みキャッシュ
+
+再実行（メンバー選択のクリック）の度に月シートを read_excel し直さず、
+ファイルパス + 更新日時をキーに全ての月シートを1回だけ解析して
+(月, メンバー, 日付, シフト) の縦持ちテーブルにし、Parquetに保存・メモリから返す。
+"""
+import calendar
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+import pandas as pd
+
+MONTH_SHEETS = list(calendar.month_name)[1:]  # 'January' 〜 'December'
+
+# 月シートのレイアウト（0始まり）
+NAME_COL = 1      # 表示名
+LOGIN_COL = 2     # ログインID
+DATE_ROW = 3      # 日付の行
+MEMBER_START_ROW = 4
+DAY_COLS = slice(10, 41)  # 1日〜31日
+
+SHIFT_COLUMNS = ['month', 'row', 'member', 'login', 'date', 'day', 'shift']
+
+_cache: Dict[str, Tuple[int, pd.DataFrame]] = {}
+_cache_lock = threading.Lock()
+
+
+def _to_text(value):
+    """セル値を文字列に揃える（13.0 → '13'、空 → None）"""
+    if pd.isna(value):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def parse_month_sheet(df: pd.DataFrame, month: str) -> pd.DataFrame:
+    """月シート1枚を縦持ち（メンバー行 × 日付）に変換"""
+    dates = pd.to_datetime(df.iloc[DATE_ROW, DAY_COLS], errors='coerce')
+    members = df.iloc[MEMBER_START_ROW:]
+    shifts = members.iloc[:, DAY_COLS]
+
+    valid = dates.notna().to_numpy()
+    dates = dates[valid]
+    shifts = shifts.loc[:, valid]
+    n_rows, n_days = shifts.shape
+
+    return pd.DataFrame({
+        'month': month,
+        'row': (members.index.to_numpy() - MEMBER_START_ROW).repeat(n_days),
+        'member': [_to_text(v) for v in members.iloc[:, NAME_COL] for _ in range(n_days)],
+        'login': [_to_text(v) for v in members.iloc[:, LOGIN_COL] for _ in range(n_days)],
+        'date': pd.DatetimeIndex(dates.to_numpy()).tolist() * n_rows,
+        'day': [d.day for d in dates] * n_rows,
+        'shift': [_to_text(v) for v in shifts.to_numpy().ravel()],
+    }, columns=SHIFT_COLUMNS)
+
+
+def parse_workbook(file_path: Path) -> pd.DataFrame:
+    """ブックを1回だけ開き、全ての月シートを解析"""
+    with pd.ExcelFile(file_path) as excel:
+        months = [sheet for sheet in excel.sheet_names if sheet in MONTH_SHEETS]
+        frames = [parse_month_sheet(excel.parse(month), month) for month in months]
+    if not frames:
+        return pd.DataFrame(columns=SHIFT_COLUMNS)
+    table = pd.concat(frames, ignore_index=True)
+    table['row'] = table['row'].astype('int32')
+    table['day'] = table['day'].astype('int8')
+    return table
+
+
+def _parquet_path(file_path: Path, mtime_ns: int) -> Path:
+    return file_path.parent / 'cache' / f"{file_path.stem}_{mtime_ns}.parquet"
+
+
+def load_shift_table(file_path) -> pd.DataFrame:
+    """解析済みのシフト表を返す（メモリ → Parquet → Excel の順に探す）"""
+    file_path = Path(file_path)
+    mtime_ns = file_path.stat().st_mtime_ns
+    key = str(file_path.resolve())
+
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+
+        parquet_path = _parquet_path(file_path, mtime_ns)
+        try:
+            table = pd.read_parquet(parquet_path)
+        except (OSError, ValueError):
+            table = parse_workbook(file_path)
+            parquet_path.parent.mkdir(parents=True, exist_ok=True)
+            # 古い更新日時のキャッシュは削除
+            for old in parquet_path.parent.glob(f"{file_path.stem}_*.parquet"):
+                old.unlink(missing_ok=True)
+            temp_path = parquet_path.with_suffix('.tmp')
+            table.to_parquet(temp_path, index=False)
+            temp_path.replace(parquet_path)
+
+        _cache[key] = (mtime_ns, table)
+        return table
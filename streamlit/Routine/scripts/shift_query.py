@@ -0,0 +1,175 @@
+"""シフト表の検索
+
+shift_data の縦持ちテーブルをカテゴリ型にし、(月, メンバー)・(月, ログインID)・日付の
+索引を1回だけ作る。描画の度に set_index・リスト内包での絞り込み・iloc[:, 9:40] を
+やり直さず、「メンバーXのM月」「D日に出勤する人」を辞書引きで返す。
+"""
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from scripts.shift_data import load_shift_table
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+# 個人表示のメンバー一覧から除く行（表示名で判定）
+EXCLUDED_MEMBER_TERMS = ['Wk#', 'Total', 'train', 'LS', 'Associate', 'Manager']
+# 全員表示から除く行（ログインIDで判定）
+EXCLUDED_LOGIN_PATTERN = 'wk#|total|train'
+OFF_SHIFTS = ['OFF', 'PAID', 'PL']
+
+# シフトの分類（判定順）と表示スタイル
+SHIFT_CLASSES = ['8', '6', '14', 'OFF', '']
+SHIFT_CSS = {
+    '8': 'color: red; font-weight: bold;',
+    '6': 'color: #00bfff; font-weight: bold;',
+    '14': 'color: #ffd700; font-weight: bold;',
+    'OFF': 'background-color: #90caf9;',
+    '': '',
+}
+CALENDAR_CELL_CSS = 'height: 60px; text-align: center; vertical-align: middle;'
+
+
+def classify_shift(code: Optional[str]) -> str:
+    """シフトコードを 8/6/14/OFF(OFF・PAID・PL)/'' に分類"""
+    if code is None or pd.isna(code):
+        return ''
+    part = str(code).split('/')[-1].strip()
+    for shift_class in ('8', '6', '14'):
+        if shift_class in part:
+            return shift_class
+    if any(x in str(code).upper() for x in OFF_SHIFTS):
+        return 'OFF'
+    return ''
+
+
+def shift_styles(classes: pd.DataFrame, base_css: str = '') -> pd.DataFrame:
+    """分類のデータフレームを同じ形のCSSに変換（Styler.apply(axis=None) 用）"""
+    css = np.array([f"{base_css} {SHIFT_CSS[c]}".strip() for c in SHIFT_CLASSES] + [base_css], dtype=object)
+    codes = pd.Categorical(classes.to_numpy().ravel(), categories=SHIFT_CLASSES).codes
+    # 分類外（codes == -1）は base_css のみ
+    return pd.DataFrame(css[codes].reshape(classes.shape), index=classes.index, columns=classes.columns)
+
+
+class ShiftQuery:
+    def __init__(self, table: pd.DataFrame):
+        self.source = table
+        table = table.reset_index(drop=True)
+        shift = table['shift'].fillna('').str.upper()
+        table['working'] = (shift != '') & ~shift.str.contains('|'.join(OFF_SHIFTS))
+        for col in ('month', 'member', 'login', 'shift'):
+            table[col] = table[col].astype('category')
+        # 分類は種類の少ないカテゴリ毎に1回だけ判定
+        categories = table['shift'].cat.categories
+        class_of = dict(zip(categories, (classify_shift(code) for code in categories)))
+        table['shift_class'] = pd.Categorical(
+            table['shift'].astype(object).map(class_of).fillna(''), categories=SHIFT_CLASSES
+        )
+        self.table = table
+
+        # groupby().indices は キー → 行位置の配列
+        self._months = list(dict.fromkeys(self.source['month']))
+        self._by_member = self._first_row_index(table.groupby(['month', 'member'], observed=True).indices)
+        self._by_login = self._first_row_index(table.groupby(['month', 'login'], observed=True).indices)
+        self._by_month: Dict[str, np.ndarray] = table.groupby('month', observed=True).indices
+        self._by_date: Dict[pd.Timestamp, np.ndarray] = table.groupby('date').indices
+
+    def _first_row_index(self, indices: Dict[Tuple[str, str], np.ndarray]) -> Dict[Tuple[str, str], np.ndarray]:
+        """同名の行が複数ある場合は最初の行だけを残す（従来の df.loc[名前] 相当）"""
+        rows = self.table['row'].to_numpy()
+        return {key: positions[rows[positions] == rows[positions[0]]] for key, positions in indices.items()}
+
+    def months(self) -> List[str]:
+        """シートの並び順"""
+        return list(self._months)
+
+    def month(self, month: str) -> pd.DataFrame:
+        if month not in self._by_month:
+            raise KeyError(f"{month} のシートがありません")
+        return self.table.take(self._by_month[month])
+
+    def member_month(self, month: str, member: Optional[str] = None, login: Optional[str] = None) -> pd.DataFrame:
+        """メンバー1人・1か月分（同名の行が複数ある場合は最初の行）"""
+        positions = self._by_login.get((month, login)) if login is not None else self._by_member.get((month, member))
+        if positions is None:
+            raise KeyError(login or member)
+        return self.table.take(positions)
+
+    def on_date(self, date, working_only: bool = True) -> pd.DataFrame:
+        """指定日のシフト（working_only なら休み・空欄を除く）"""
+        positions = self._by_date.get(pd.Timestamp(date))
+        if positions is None:
+            return self.table.iloc[0:0]
+        if working_only:
+            positions = positions[self.table['working'].to_numpy()[positions]]
+        return self.table.take(positions)
+
+    def members(self, month: str, me: Optional[str] = None) -> List[str]:
+        """個人表示のメンバー一覧（ログインIDが me の行は me と表示する）"""
+        people = self.month(month).drop_duplicates('row')
+        names = people['member'].astype(object)
+        if me is not None:
+            names = names.where(people['login'].astype(object) != me, me)
+        names = names.dropna()
+        lowered = names.str.lower()
+        excluded = np.zeros(len(names), dtype=bool)
+        for term in EXCLUDED_MEMBER_TERMS:
+            excluded |= lowered.str.contains(term.lower(), regex=False).to_numpy()
+        names = names[~excluded & ~names.str[:1].str.isdigit().to_numpy()]
+        return list(dict.fromkeys(names))
+
+    def member_table(self, month: str, values: str = 'shift') -> pd.DataFrame:
+        """全員分のシフト（行: 表示名、列: 1日〜）。values='shift_class' で分類を返す"""
+        rows = self.month(month)
+        logins = rows['login'].astype(object).fillna('').astype(str)
+        rows = rows[
+            (logins != '')
+            & ~logins.str[:1].str.isdigit()
+            & ~logins.str.lower().str.contains(EXCLUDED_LOGIN_PATTERN)
+        ]
+        grid = rows.pivot(index='row', columns='day', values=values)
+        grid.columns = [f"{day}日" for day in grid.columns]
+        names = rows.drop_duplicates('row').set_index('row')['member'].astype(object)
+        grid.index = names.reindex(grid.index).rename(None)
+        return grid.astype(object)
+
+    @staticmethod
+    def calendar_grid(member_rows: pd.DataFrame, values: str = 'label') -> pd.DataFrame:
+        """1人・1か月分を 週 × 曜日 のカレンダーにする（シフトの無い週は除く）
+
+        values='label' は「D日 / シフト」、values='shift_class' は同じ形の分類。
+        """
+        rows = member_rows[member_rows['shift'].notna()]
+        if rows.empty:
+            return pd.DataFrame(columns=WEEKDAYS)
+        dates = pd.DatetimeIndex(member_rows['date'])
+        first = dates.min()
+        days = (pd.DatetimeIndex(rows['date']) - first).days.to_numpy()
+        week = (days + first.weekday()) // 7
+        if values == 'label':
+            cells = rows['day'].astype(str).to_numpy() + '日 / ' + rows['shift'].astype(str).to_numpy()
+        else:
+            cells = rows[values].astype(object).to_numpy()
+
+        # 週 × 曜日 の配列へ一括で代入（シフトの無い週は詰める）
+        weeks, week_pos = np.unique(week, return_inverse=True)
+        grid = np.full((len(weeks), 7), '', dtype=object)
+        grid[week_pos, pd.DatetimeIndex(rows['date']).weekday.to_numpy()] = cells
+        return pd.DataFrame(grid, columns=WEEKDAYS)
+
+
+_queries: Dict[str, ShiftQuery] = {}
+_queries_lock = threading.Lock()
+
+
+def get_shift_query(file_path) -> ShiftQuery:
+    """解析済みテーブルが変わった時だけ索引を作り直す"""
+    table = load_shift_table(file_path)
+    key = str(Path(file_path).resolve())
+    with _queries_lock:
+        query = _queries.get(key)
+        if query is None or query.source is not table:
+            query = _queries[key] = ShiftQuery(table)
+        return query
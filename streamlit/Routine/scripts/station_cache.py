@@ -0,0 +1,127 @@
+"""ステーション毎の取得結果のTTLキャッシュ
+
+同じステーションを何度も検索する場合に備え、取得結果をステーション毎に保持する。
+TTL内ならそのまま返し、TTLを過ぎたものは古い結果をすぐ返してから
+バックグラウンドで取り直す（stale-while-revalidate）。未取得のものだけ待つ。
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from scripts.station_fetch import StationFetcher
+
+logger = logging.getLogger(__name__)
+
+CORTEX_TTL_SECONDS = 60
+ROSTER_TTL_SECONDS = 10 * 60
+
+# (ステーション, 結果, エラー, 取得からの経過秒数)
+CachedResult = Tuple[str, Any, Optional[BaseException], float]
+
+
+class StationCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, Any]] = {}
+        self._refreshing: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def lookup(self, station: str) -> Optional[Tuple[Any, float]]:
+        """(結果, 経過秒数)。未取得なら None"""
+        with self._lock:
+            entry = self._entries.get(station)
+        if entry is None:
+            return None
+        fetched_at, value = entry
+        return value, time.monotonic() - fetched_at
+
+    def store(self, station: str, value: Any) -> None:
+        with self._lock:
+            self._entries[station] = (time.monotonic(), value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _refresh(
+        self,
+        fetcher: StationFetcher,
+        stations: Iterable[str],
+        fetch: Callable[[str], Any],
+        cache_if: Optional[Callable[[Any], bool]],
+        run_kwargs: dict,
+    ) -> None:
+        stations = list(stations)
+        try:
+            for station, value, error in fetcher.run(stations, fetch, **run_kwargs):
+                if error is None and (cache_if is None or cache_if(value)):
+                    self.store(station, value)
+        except Exception as e:
+            # 認証エラーなど。古い結果を残し、次の検索で取り直す
+            logger.warning(f"Background refresh stopped: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(stations)
+
+    def run(
+        self,
+        fetcher: StationFetcher,
+        stations: Iterable[str],
+        fetch: Callable[[str], Any],
+        cache_if: Optional[Callable[[Any], bool]] = None,
+        **run_kwargs,
+    ) -> Iterator[CachedResult]:
+        """キャッシュ済みの結果を先に返し、未取得のものを fetcher で取得して完了順に返す
+
+        cache_if(結果) が False の結果（取得失敗を表す空の結果など）は保存しない。
+        run_kwargs は StationFetcher.run にそのまま渡す（auth_errors・should_retry・max_workers）。
+        """
+        missing, stale = [], []
+        for station in stations:
+            cached = self.lookup(station)
+            if cached is None:
+                missing.append(station)
+                continue
+            value, age = cached
+            if age > self.ttl:
+                stale.append(station)
+            yield station, value, None, age
+
+        with self._lock:
+            stale = [station for station in stale if station not in self._refreshing]
+            self._refreshing.update(stale)
+        if stale:
+            threading.Thread(target=self._refresh, args=(fetcher, stale, fetch, cache_if, run_kwargs), daemon=True).start()
+
+        for station, value, error in fetcher.run(missing, fetch, **run_kwargs):
+            if error is None and (cache_if is None or cache_if(value)):
+                self.store(station, value)
+            yield station, value, error, 0.0
+
+
+def age_label(age: float) -> str:
+    if age < 1:
+        return '最新'
+    if age < 60:
+        return f"{int(age)}秒前"
+    return f"{int(age // 60)}分前"
+
+
+def format_ages(ages: Dict[str, float]) -> str:
+    """ステーション毎のデータの古さ（例: 'DAI1 最新 / ONGA 45秒前'）"""
+    return ' / '.join(f"{station} {age_label(age)}" for station, age in ages.items())
+
+
+_caches: Dict[str, StationCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_station_cache(name: str, ttl: float) -> StationCache:
+    """ページ毎（取得内容毎）のプロセス共通キャッシュ"""
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = StationCache(ttl)
+        cache = _caches[name]
+        cache.ttl = ttl
+        return cache
@@ -0,0 +1,151 @@
+"""複数ステーションの並列取得
+
+ページ毎に ThreadPoolExecutor(max_workers=10) を作ると、同時に開いたページ・
+セッションの分だけ同時接続が増える。ここではプロセス共通の同時実行数と
+レート（トークンバケット）の上限の下でステーションを並列に取得し、
+一時的なエラーはジッター付き指数バックオフで再試行する。
+認証エラーが1件でも出たら残りを全て取り消し、結果は完了した順に返す。
+"""
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple, Type
+
+DEFAULT_MAX_CONCURRENCY = 10
+DEFAULT_RATE_PER_SECOND = 10.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 8.0
+
+# (ステーション, 結果, エラー)
+StationResult = Tuple[str, Any, Optional[BaseException]]
+
+
+class Cancelled(Exception):
+    """認証エラーなどで実行が取り消された"""
+
+
+class RateLimiter:
+    """トークンバケット（rate 件/秒、最大 burst 件まで連続で通す）"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cancel: threading.Event) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            if cancel.wait(wait_seconds):
+                raise Cancelled()
+
+
+class StationFetcher:
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        rate_per_second: float = DEFAULT_RATE_PER_SECOND,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # 全ての実行（ページ・セッション）で共有する上限
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._rate = RateLimiter(rate_per_second)
+
+    def backoff(self, attempt: int) -> float:
+        """attempt 回目の失敗後の待ち時間（full jitter）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _call(
+        self,
+        station: str,
+        fetch: Callable[[str], Any],
+        cancel: threading.Event,
+        auth_errors: Tuple[Type[BaseException], ...],
+        should_retry: Optional[Callable[[Any], bool]],
+    ) -> Any:
+        for attempt in range(self.max_retries):
+            if cancel.is_set():
+                raise Cancelled()
+            try:
+                with self._slots:
+                    self._rate.acquire(cancel)
+                    result = fetch(station)
+            except auth_errors:
+                raise
+            except Exception:
+                if attempt == self.max_retries - 1:
+                    raise
+            else:
+                if should_retry is None or not should_retry(result) or attempt == self.max_retries - 1:
+                    return result
+            if cancel.wait(self.backoff(attempt)):
+                raise Cancelled()
+
+    def run(
+        self,
+        stations: Iterable[str],
+        fetch: Callable[[str], Any],
+        auth_errors: Tuple[Type[BaseException], ...] = (),
+        should_retry: Optional[Callable[[Any], bool]] = None,
+        max_workers: Optional[int] = None,
+    ) -> Iterator[StationResult]:
+        """fetch(station) を並列に実行し、完了した順に (station, 結果, エラー) を返す
+
+        should_retry(結果) が True の場合（空の結果など）も再試行する。
+        auth_errors のエラーが出たら未完了の取得を取り消し、そのエラーを送出する。
+        max_workers は この実行の並列数の上限（fetch が WebDriver など数の限られた
+        資源を待つ場合に、その数を超えて共通の同時実行枠を占有しないようにする）。
+        """
+        stations = list(stations)
+        cancel = threading.Event()
+        workers = min(len(stations), self.max_concurrency, max_workers or self.max_concurrency)
+        executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        try:
+            pending = {
+                executor.submit(self._call, station, fetch, cancel, auth_errors, should_retry): station
+                for station in stations
+            }
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    station = pending.pop(future)
+                    error = future.exception()
+                    if isinstance(error, auth_errors):
+                        cancel.set()
+                        for other in pending:
+                            other.cancel()
+                        raise error
+                    yield station, (None if error else future.result()), error
+        finally:
+            # 途中で止めた場合（認証エラー・呼び出し側の break）も残りを止める
+            cancel.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_fetcher: Optional[StationFetcher] = None
+_fetcher_lock = threading.Lock()
+
+
+def get_station_fetcher() -> StationFetcher:
+    """プロセス共通の取得器を返す"""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = StationFetcher()
+        return _fetcher
@@ -0,0 +1,67 @@
+"""station_code → service_area_id の索引
+
+dsp_info.csv を呼び出しの度に pandas で読み直さず、プロセス内で1回だけ読み込んで
+辞書で引く。ファイルの更新日時・サイズが変わったら次のlookupで自動的に読み直す。
+※ flet/SP_sest からも sys.path 経由でこのファイルを読み込む（コピーは置かない）
+"""
+import csv
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+
+class StationIndex:
+    def __init__(self, csv_path):
+        self.csv_path = Path(csv_path)
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple[float, int]] = None
+        self._index: Dict[str, str] = {}
+
+    def _load(self) -> Dict[str, str]:
+        index: Dict[str, str] = {}
+        with open(self.csv_path, encoding='utf-8-sig', newline='') as f:
+            for row in csv.DictReader(f):
+                station_code = (row.get('station_code') or '').strip().upper()
+                # 重複行は最初の行を優先（従来の .iloc[0] と同じ）
+                if station_code and station_code not in index:
+                    index[station_code] = row['service_area_id']
+        return index
+
+    def _refresh(self) -> Dict[str, str]:
+        stat = os.stat(self.csv_path)
+        stamp = (stat.st_mtime, stat.st_size)
+        with self._lock:
+            if stamp != self._stamp:
+                self._index = self._load()
+                self._stamp = stamp
+            return self._index
+
+    def get(self, station_code: str) -> Optional[str]:
+        return self._refresh().get(station_code.strip().upper())
+
+    def lookup(self, station_code: str) -> str:
+        """見つからない場合は KeyError"""
+        service_area_id = self.get(station_code)
+        if service_area_id is None:
+            raise KeyError(f"Invalid station code: {station_code}")
+        return service_area_id
+
+    def __contains__(self, station_code: str) -> bool:
+        return self.get(station_code) is not None
+
+    def station_codes(self):
+        return list(self._refresh())
+
+
+_indexes: Dict[str, StationIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_station_index(csv_path) -> StationIndex:
+    """CSVパス毎にプロセス共通の索引を返す"""
+    key = os.path.abspath(csv_path)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = StationIndex(csv_path)
+        return _indexes[key]
@@ -0,0 +1,184 @@
+"""WebDriverプール
+
+ページ毎・ステーション毎にChromeを起動し直さず、認証済みのドライバーを
+プロセス内で使い回す。Streamlitの再実行をまたいで st.cache_resource で保持する。
+"""
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import streamlit as st
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+PROFILE_PATH = f"C:\\Users\\{os.getenv('USERNAME')}\\AppData\\Local\\Google\\Chrome\\python"
+MIDWAY_MARKER = 'Midway'
+
+
+@lru_cache(maxsize=1)
+def chromedriver_path() -> str:
+    """ChromeDriverのパス解決はプロセスで1回だけ行う"""
+    return ChromeDriverManager().install()
+
+
+def create_driver(headless: bool = False, profile_path: str = PROFILE_PATH) -> webdriver.Chrome:
+    options = webdriver.ChromeOptions()
+    options.add_argument(f'--user-data-dir={profile_path}')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--disable-software-rasterizer')
+
+    if headless:
+        options.add_argument('--headless=new')
+        options.add_argument('--disable-extensions')
+
+    options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    return webdriver.Chrome(service=Service(chromedriver_path()), options=options)
+
+
+def _read_marker(profile_path: str) -> Optional[str]:
+    try:
+        with open(os.path.join(profile_path, MIDWAY_MARKER)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _slot_profile(slot: int) -> str:
+    """スロット毎のプロファイル（同じuser-data-dirは同時に使えないため）
+
+    スロット0は認証用のプロファイルそのもの。それ以外は認証日が変わった時に
+    スロット0からコピーして、Midway Cookieを引き継ぐ。
+    """
+    if slot == 0:
+        return PROFILE_PATH
+
+    profile_path = f"{PROFILE_PATH}_{slot}"
+    base_marker = _read_marker(PROFILE_PATH)
+    if base_marker and _read_marker(profile_path) != base_marker:
+        shutil.rmtree(profile_path, ignore_errors=True)
+        shutil.copytree(
+            PROFILE_PATH, profile_path,
+            ignore=shutil.ignore_patterns('Singleton*', '*.lock', 'Cache', 'Code Cache', 'GPUCache'),
+            dirs_exist_ok=True
+        )
+    return profile_path
+
+
+def is_alive(driver) -> bool:
+    """ドライバーが応答するか（ブラウザが閉じられていないか）"""
+    try:
+        driver.execute_script('return 1')
+        return True
+    except Exception:
+        return False
+
+
+class DriverPool:
+    def __init__(self, max_size: int = 4, idle_timeout: float = 600, headless: bool = True):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.headless = headless
+        self._idle: List[tuple] = []  # (slot, driver, 最終使用時刻)
+        self._busy: Dict[int, object] = {}
+        self._cond = threading.Condition()
+
+        threading.Thread(target=self._reap_loop, daemon=True).start()
+
+    def _free_slot(self) -> Optional[int]:
+        used = set(self._busy) | {slot for slot, _, _ in self._idle}
+        for slot in range(self.max_size):
+            if slot not in used:
+                return slot
+        return None
+
+    def checkout(self, timeout: Optional[float] = None):
+        """空いているドライバーを取り出す（無ければ起動、上限なら待機）"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                while self._idle:
+                    slot, driver, _ = self._idle.pop()
+                    if is_alive(driver):
+                        self._busy[slot] = driver
+                        return slot, driver
+                    self._quit(driver)
+
+                slot = self._free_slot()
+                if slot is not None:
+                    # 起動中は他のスレッドにスロットを取られないよう予約しておく
+                    self._busy[slot] = None
+                    break
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("利用可能なWebDriverがありません")
+                self._cond.wait(remaining)
+
+        try:
+            driver = create_driver(headless=self.headless, profile_path=_slot_profile(slot))
+        except Exception:
+            with self._cond:
+                del self._busy[slot]
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._busy[slot] = driver
+        return slot, driver
+
+    def checkin(self, slot: int, driver, healthy: bool = True) -> None:
+        with self._cond:
+            self._busy.pop(slot, None)
+            if healthy and is_alive(driver):
+                self._idle.append((slot, driver, time.monotonic()))
+            else:
+                self._quit(driver)
+            self._cond.notify()
+
+    @contextmanager
+    def driver(self, timeout: Optional[float] = None):
+        slot, driver = self.checkout(timeout)
+        try:
+            yield driver
+        finally:
+            # 応答しなくなったドライバーはcheckin時に破棄される
+            self.checkin(slot, driver)
+
+    def close_all(self) -> None:
+        """待機中のドライバーを全て終了（Midwayリセットや認証用ブラウザの起動前に呼ぶ）"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for _, driver, _ in idle:
+            self._quit(driver)
+
+    def _reap_loop(self) -> None:
+        while True:
+            time.sleep(60)
+            now = time.monotonic()
+            with self._cond:
+                expired = [item for item in self._idle if now - item[2] > self.idle_timeout]
+                self._idle = [item for item in self._idle if now - item[2] <= self.idle_timeout]
+                if expired:
+                    self._cond.notify_all()
+            for _, driver, _ in expired:
+                self._quit(driver)
+
+    @staticmethod
+    def _quit(driver) -> None:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+
+@st.cache_resource
+def get_driver_pool(max_size: int = 4) -> DriverPool:
+    """Streamlitの再実行をまたいで共有するプール"""
+    return DriverPool(max_size=max_size)
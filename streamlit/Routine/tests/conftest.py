@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# アプリと同じく streamlit/Routine をカレントにした場合と同じ import（from scripts.X import ...）にする
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
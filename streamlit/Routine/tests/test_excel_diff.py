@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+from openpyxl.utils import get_column_letter
+
+from scripts.excel_diff import compare_by_key, compare_dataframes
+
+
+def test_mixed_type_column_only_reports_changed_row():
+    df1 = pd.DataFrame({'id': np.arange(1000), 'value': np.arange(1000) * 1.5})
+    df2 = df1.copy()
+    df2['value'] = df2['value'].astype(object)
+    df2.loc[5, 'value'] = 'N/A'
+
+    differences = compare_by_key(df1, df2, 'Sheet1')
+
+    # 行内容のハッシュで対応付けるため、変更された行は削除+追加になる
+    assert [(d['差分種別'], d['行']) for d in differences] == [('削除', 6), ('追加', 6)]
+
+
+def test_int_column_with_appended_empty_row():
+    df1 = pd.DataFrame({'id': [1, 2, 3], 'name': ['a', 'b', 'c']})
+    df2 = pd.DataFrame({'id': [1, 2, 3, np.nan], 'name': ['a', 'b', 'c', 'd']})
+
+    differences = compare_by_key(df1, df2, 'Sheet1')
+
+    assert [(d['差分種別'], d['行']) for d in differences] == [('追加', 4)]
+
+
+def compare_cellwise(df1, df2):
+    """旧実装（セル毎の iloc）と同じ判定"""
+    differences = []
+    all_columns = list(df1.columns) + [col for col in df2.columns if col not in df1.columns]
+    for col_pos, col in enumerate(all_columns):
+        for idx in range(max(len(df1), len(df2))):
+            val1 = df1.iloc[idx][col] if idx < len(df1) and col in df1.columns else np.nan
+            val2 = df2.iloc[idx][col] if idx < len(df2) and col in df2.columns else np.nan
+            if pd.isna(val1) and pd.isna(val2):
+                continue
+            if pd.isna(val1) != pd.isna(val2) or val1 != val2:
+                differences.append((get_column_letter(col_pos + 1), idx + 1))
+    return differences
+
+
+def test_compare_dataframes_matches_cellwise_comparison():
+    rng = np.random.default_rng(0)
+    n_rows = 500
+    data = {f'num{c}': rng.integers(0, 1000, n_rows).astype(float) for c in range(3)}
+    data.update({f'str{c}': rng.choice(['A', 'B', 'C', None], n_rows) for c in range(3)})
+    df1 = pd.DataFrame(data)
+    df2 = df1.copy()
+    # 1%のセルを変更し、末尾に行を追加
+    for col in df2.columns:
+        rows = rng.choice(n_rows, n_rows // 100, replace=False)
+        df2.loc[rows, col] = 'X' if col.startswith('str') else -1.0
+    df2 = pd.concat([df2, df2.tail(10)], ignore_index=True)
+
+    result = compare_dataframes(df1, df2, 'Sheet1')
+
+    assert [(d['セル'].rstrip('0123456789'), d['行']) for d in result] == compare_cellwise(df1, df2)
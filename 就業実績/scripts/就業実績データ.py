@@ -1,12 +1,21 @@
+import sys
 from pathlib import Path
 import requests
-from requests_negotiate_sspi import HttpNegotiateAuth
 import urllib3
 import logging
 import pandas as pd
-from datetime import datetime, timezone
-import pytz
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, List, Optional
+import hashlib
+import json
+import threading
+import time
 import io
+# SharePointクライアントは streamlit/Routine/scripts の1ファイルを共用する
+sys.path.append(str(Path(__file__).resolve().parents[2] / 'streamlit' / 'Routine' / 'scripts'))
+from sharepoint import get_client
 
 # ログの設定
 logging.basicConfig(
@@ -15,152 +24,343 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 除外するファイル名のリスト
+EXCLUDE_FILES = ['Audit一覧.xlsx', '就業実績_管理DB.xlsx']
+FOLDER_PATH = '/sites/COJP_ORM/Shared Documents/06_Project/就業実績'
+OUTPUT_DIR = Path(r'C:\Users\tangtao\Desktop\TAO\PJ\就業実績\data')
+SNAPSHOT_DIR = OUTPUT_DIR / 'snapshots'
+
+
+class SnapshotManifest:
+    """ファイル毎の更新日時・サイズと解析済みスナップショットを管理する"""
+
+    def __init__(self, snapshot_dir: Path = SNAPSHOT_DIR):
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = snapshot_dir / 'manifest.json'
+        self._lock = threading.Lock()
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.entries: Dict[str, dict] = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def _snapshot_path(self, key: str) -> Path:
+        return self.snapshot_dir / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.pkl"
+
+    def is_fresh(self, file: dict) -> bool:
+        """SharePoint上の更新日時・サイズが前回と同じならTrue"""
+        key = file['ServerRelativeUrl']
+        entry = self.entries.get(key)
+        return (entry is not None
+                and entry['time_last_modified'] == file['TimeLastModified']
+                and entry['length'] == str(file.get('Length', ''))
+                and self._snapshot_path(key).exists())
+
+    def load(self, file: dict) -> pd.DataFrame:
+        return pd.read_pickle(self._snapshot_path(file['ServerRelativeUrl']))
+
+    def store(self, file: dict, df: pd.DataFrame) -> None:
+        key = file['ServerRelativeUrl']
+        df.to_pickle(self._snapshot_path(key))
+        with self._lock:
+            self.entries[key] = {
+                'name': file['Name'],
+                'time_last_modified': file['TimeLastModified'],
+                'length': str(file.get('Length', ''))
+            }
+
+    def prune(self, keys) -> None:
+        """フォルダから消えたファイルのスナップショットを削除"""
+        for key in set(self.entries) - set(keys):
+            self._snapshot_path(key).unlink(missing_ok=True)
+            del self.entries[key]
+
+    def save(self) -> None:
+        temp_path = self.manifest_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        temp_path.replace(self.manifest_path)
+
+
+class MergedFileWriter:
+    """解析済みのデータフレームを順次出力ファイルへ追記する（CSV / Parquet）
+
+    Parquet はファイル毎に列の型が違う場合がある（全て空の列が float/null になる等）。
+    各ファイルを一時的な部分ファイルに書き出しておき、close() で全ファイルの
+    スキーマを統一してから1つのファイルにまとめる（メモリには1ファイル分のみ）。
+    """
+
+    def __init__(self, output_path: Path, output_format: str = 'csv'):
+        if output_format not in ('csv', 'parquet'):
+            raise ValueError(f"Invalid output_format: {output_format}")
+        self.output_path = output_path
+        self.output_format = output_format
+        # 途中で失敗しても既存の出力を壊さないよう一時ファイルに書き込む
+        self.temp_path = output_path.with_name(output_path.name + '.part')
+        self.rows = 0
+        self._parts: List[Path] = []
+        self._started = False
+
+    def append(self, df: pd.DataFrame) -> None:
+        if self.output_format == 'csv':
+            if not self._started:
+                df.to_csv(self.temp_path, index=False, encoding='utf-8-sig')
+            else:
+                df.to_csv(self.temp_path, mode='a', header=False, index=False, encoding='utf-8')
+        else:
+            import pyarrow.parquet as pq
+
+            part_path = self.temp_path.with_name(f"{self.temp_path.name}.{len(self._parts)}")
+            pq.write_table(self.to_arrow(df), part_path)
+            self._parts.append(part_path)
+        self._started = True
+        self.rows += len(df)
+
+    @staticmethod
+    def to_arrow(df: pd.DataFrame):
+        """pa.Table に変換（数値と文字列が混在する object 列は文字列の列にする）
+
+        Excelの列には数値と文字列が混在することが多く、そのままでは
+        pa.Table.from_pandas が ArrowInvalid になってファイルごと出力から漏れる。
+        """
+        import pyarrow as pa
+
+        df = df.copy(deep=False)
+        for i in range(df.shape[1]):
+            values = df.iloc[:, i]
+            if values.dtype != object:
+                continue
+            try:
+                pa.array(values, from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                df.isetitem(i, values.astype(str).where(values.notna(), None))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+    @staticmethod
+    def unify_schemas(schemas):
+        """列毎に型を統一（null・int/float などは広い型へ、統一できない列は文字列）"""
+        import pyarrow as pa
+
+        schemas = [schema.remove_metadata() for schema in schemas]
+        try:
+            return pa.unify_schemas(schemas, promote_options='permissive')
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            fields = []
+            for name in schemas[0].names:
+                try:
+                    fields.append(pa.unify_schemas(
+                        [pa.schema([schema.field(name)]) for schema in schemas],
+                        promote_options='permissive'
+                    ).field(name))
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    fields.append(pa.field(name, pa.string()))
+            return pa.schema(fields)
+
+    def _write_parquet(self) -> None:
+        import pyarrow.parquet as pq
+
+        schema = self.unify_schemas([pq.read_schema(part) for part in self._parts])
+        with pq.ParquetWriter(self.temp_path, schema) as writer:
+            for part in self._parts:
+                writer.write_table(pq.read_table(part).cast(schema))
+
+    def _remove_parts(self) -> None:
+        for part in self._parts:
+            part.unlink(missing_ok=True)
+        self._parts = []
+
+    def close(self) -> bool:
+        """書き込みを確定する。1件も書いていなければ False"""
+        if not self._started:
+            return False
+        try:
+            if self._parts:
+                self._write_parquet()
+        finally:
+            self._remove_parts()
+        self.temp_path.replace(self.output_path)
+        return True
+
+    def abort(self) -> None:
+        self._remove_parts()
+        if self.temp_path.exists():
+            self.temp_path.unlink()
+
+
 class SharePointDataMerger:
-    def __init__(self):
+    def __init__(self, max_workers: int = 4, output_format: str = 'csv', full_refresh: bool = False):
         self.logger = logger
-        
-    def merge_sharepoint_files(self):
+        self.client = get_client()
+        self.max_workers = max_workers
+        self.output_format = output_format
+        self.full_refresh = full_refresh
+        self.manifest = SnapshotManifest()
+
+    def list_files(self) -> List[dict]:
+        """マージ対象のExcelファイル一覧を取得"""
+        folder_url = f"https://share.amazon.com/sites/COJP_ORM/_api/web/GetFolderByServerRelativeUrl('{FOLDER_PATH}')/Files"
+
+        self.logger.info("Connecting to SharePoint...")
+        files = []
+        for file in self.client.get_json(folder_url):
+            file_name = file['Name']
+
+            # 除外ファイルをスキップ
+            if file_name in EXCLUDE_FILES:
+                self.logger.info(f"Skipping excluded file: {file_name}")
+                continue
+
+            if file_name.lower().endswith(('.xlsx', '.xlsm')):
+                files.append(file)
+        return files
+
+    def fetch_and_parse(self, file: dict):
+        """1ファイルをダウンロードして解析（ワーカースレッドで実行）
+
+        前回から更新されていなければダウンロードせずスナップショットを返す。
+        """
+        if not self.full_refresh and self.manifest.is_fresh(file):
+            start = time.perf_counter()
+            df = self.manifest.load(file)
+            return df, 0.0, time.perf_counter() - start, True
+
+        file_url = f"https://share.amazon.com{file['ServerRelativeUrl']}"
+
+        start = time.perf_counter()
+        file_response = self.client.get(file_url)
+        file_response.raise_for_status()
+        downloaded = time.perf_counter()
+
+        # バイナリデータからデータフレームを作成
+        df = pd.read_excel(io.BytesIO(file_response.content))
+        parsed = time.perf_counter()
+
+        self.manifest.store(file, df)
+        return df, downloaded - start, parsed - downloaded, False
+
+    def merge_sharepoint_files(self, progress_callback: Optional[Callable[[int, int, str], None]] = None):
+        """ダウンロード・解析を並列で行い、完了したファイルから順に出力へ追記"""
+        writer = None
         try:
-            # 除外するファイル名のリスト
-            exclude_files = ['Audit一覧.xlsx', '就業実績_管理DB.xlsx']
-            
-            # 出力先のディレクトリ
-            output_dir = Path(r'C:\Users\tangtao\Desktop\TAO\PJ\就業実績\data')
-            output_dir.mkdir(parents=True, exist_ok=True)
-
-            # SharePointのファイル一覧を取得
-            folder_path = '/sites/COJP_ORM/Shared Documents/06_Project/就業実績'
-            folder_url = f"https://share.amazon.com/sites/COJP_ORM/_api/web/GetFolderByServerRelativeUrl('{folder_path}')/Files"
-            
-            session = requests.Session()
-            session.auth = HttpNegotiateAuth()
-            headers = {
-                'Accept': 'application/json;odata=verbose',
-                'Content-Type': 'application/json;odata=verbose',
-                'User-Agent': 'Python NTLM Client'
-            }
-            
-            self.logger.info("Connecting to SharePoint...")
-            response = session.get(
-                folder_url,
-                headers=headers,
-                verify=False,
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            files_data = response.json()
-            
-            # データフレームのリストを保持
-            dfs = []
+            OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+            files = self.list_files()
+            total = len(files)
+
+            suffix = 'csv' if self.output_format == 'csv' else 'parquet'
+            output_path = OUTPUT_DIR / f'merged_data.{suffix}'
+            writer = MergedFileWriter(output_path, self.output_format)
+
             first_header = None
             processed_files = []
-            
-            # 現在時刻（JST）
-            jst = pytz.timezone('Asia/Tokyo')
-            current_time = datetime.now(jst)
-            
-            # ファイルの処理
-            processed_count = 0
-            for file in files_data['d']['results']:
-                file_name = file['Name']
-                
-                # 除外ファイルをスキップ
-                if file_name in exclude_files:
-                    self.logger.info(f"Skipping excluded file: {file_name}")
-                    continue
-                
-                # 更新日時のチェック
-                modified_date = datetime.strptime(
-                    file['TimeLastModified'],
-                    '%Y-%m-%dT%H:%M:%SZ'
-                ).replace(tzinfo=timezone.utc).astimezone(jst)
-                    
-                if file_name.lower().endswith(('.xlsx', '.xlsm')):
+            reused_count = 0
+            merge_start = time.perf_counter()
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # 投入は最大 2×max_workers 件まで。書き込んだ Future は手放し、
+                # 解析済みのデータフレームを全件メモリに溜めない
+                pending = deque()
+                remaining = iter(files)
+                window = 2 * self.max_workers
+
+                def submit_next():
+                    for file in islice(remaining, window - len(pending)):
+                        pending.append((file, executor.submit(self.fetch_and_parse, file)))
+
+                submit_next()
+                i = 0
+                # 出力の行順を一覧順に保つため、投入順に結果を受け取る
+                while pending:
+                    file, future = pending.popleft()
+                    submit_next()
+                    i += 1
+                    file_name = file['Name']
                     try:
-                        file_url = f"https://share.amazon.com{file['ServerRelativeUrl']}"
-                        
-                        # ファイルの内容を直接読み込む
-                        self.logger.info(f"Reading: {file_name}")
-                        file_response = session.get(
-                            file_url,
-                            verify=False,
-                            timeout=30
-                        )
-                        file_response.raise_for_status()
-                        
-                        # バイナリデータからデータフレームを作成
-                        df = pd.read_excel(io.BytesIO(file_response.content))
-                        
-                        # データフレームが空でないことを確認
-                        if not df.empty:
-                            # 最初のファイルのヘッダーを保存
-                            if first_header is None:
-                                first_header = df.columns.tolist()
-                                self.logger.info(f"First header set from {file_name}: {first_header}")
-                            
-                            # ヘッダーを統一
-                            if len(df.columns) == len(first_header):
-                                df.columns = first_header
-                                dfs.append(df)
-                                processed_files.append(file_name)
-                                processed_count += 1
-                                self.logger.info(f"Successfully processed: {file_name}")
-                            else:
-                                self.logger.warning(f"Skipping {file_name} due to different column count")
+                        df, download_time, parse_time, reused = future.result()
+                        del future
+                        if reused:
+                            reused_count += 1
+                            self.logger.info(f"[{i}/{total}] {file_name}: unchanged, snapshot {parse_time:.2f}s, {len(df)} rows")
                         else:
+                            self.logger.info(
+                                f"[{i}/{total}] {file_name}: download {download_time:.2f}s, "
+                                f"parse {parse_time:.2f}s, {len(df)} rows"
+                            )
+
+                        # データフレームが空でないことを確認
+                        if df.empty:
                             self.logger.warning(f"Skipping empty file: {file_name}")
-                            
+                            continue
+
+                        # 最初のファイルのヘッダーを保存
+                        if first_header is None:
+                            first_header = df.columns.tolist()
+                            self.logger.info(f"First header set from {file_name}: {first_header}")
+
+                        # ヘッダーを統一
+                        if len(df.columns) != len(first_header):
+                            self.logger.warning(f"Skipping {file_name} due to different column count")
+                            continue
+
+                        df.columns = first_header
+                        writer.append(df)
+                        del df
+                        processed_files.append(file_name)
+                        self.logger.info(f"Successfully processed: {file_name}")
+
                     except Exception as e:
                         self.logger.error(f"Error processing file {file_name}: {str(e)}")
                         continue
-            
-            # すべてのデータフレームを結合
-            if dfs:
-                self.logger.info(f"Merging {len(dfs)} files: {', '.join(processed_files)}")
-                merged_df = pd.concat(dfs, ignore_index=True)
-                
-                # 結合されたデータの検証
-                self.logger.info(f"Merged data shape: {merged_df.shape}")
-                
-                # CSVとして保存
-                output_path = output_dir / 'merged_data.csv'
-                merged_df.to_csv(output_path, index=False, encoding='utf-8-sig')
-                self.logger.info(f"Created merged CSV file at: {output_path}")
-                
+                    finally:
+                        if progress_callback:
+                            progress_callback(i, total, file_name)
+
+            self.manifest.prune(file['ServerRelativeUrl'] for file in files)
+            self.manifest.save()
+            self.logger.info(f"Unchanged files reused from snapshot: {reused_count}/{total}")
+
+            if writer.close():
+                self.logger.info(f"Merged {len(processed_files)} files: {', '.join(processed_files)}")
+                self.logger.info(f"Merged data rows: {writer.rows}")
+                self.logger.info(f"Created merged file at: {output_path}")
+
                 # 結合されたファイルのサイズを確認
                 file_size = output_path.stat().st_size
                 self.logger.info(f"Merged file size: {file_size} bytes")
             else:
                 self.logger.warning("No files were successfully processed for merging")
-            
-            self.logger.info(f"Process completed. Total files processed and merged: {processed_count}")
+
+            self.logger.info(
+                f"Process completed. Total files processed and merged: {len(processed_files)} "
+                f"({time.perf_counter() - merge_start:.1f}s)"
+            )
             return True
-            
+
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Network error: {str(e)}")
-            return False
         except ValueError as e:
             self.logger.error(f"JSON parsing error: {str(e)}")
-            return False
         except Exception as e:
             self.logger.error(f"Unexpected error: {str(e)}")
-            return False
+
+        if writer is not None:
+            writer.abort()
+        return False
 
 # メイン実行部分
 if __name__ == "__main__":
     try:
         # SSL警告を無視
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-        
+
         logger.info("Starting merge process...")
         merger = SharePointDataMerger()
         result = merger.merge_sharepoint_files()
-        
+
         if result:
             logger.info("Process completed successfully")
         else:
             logger.error("Process completed with errors")
-            
+
     except Exception as e:
         logger.error(f"Main process error: {str(e)}")
@@ -0,0 +1,26 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+# sharepoint.py の依存（Windows の Negotiate 認証）が無い環境では読み込めない
+pytest.importorskip('requests_negotiate_sspi')
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'scripts'))
+from 就業実績データ import MergedFileWriter  # noqa: E402
+
+
+def test_parquet_keeps_files_with_mixed_type_columns(tmp_path):
+    writer = MergedFileWriter(tmp_path / 'merged.parquet', 'parquet')
+    writer.append(pd.DataFrame({'id': [1, 2], 'memo': ['a', 'b'], 'hours': [np.nan, np.nan]}))
+    writer.append(pd.DataFrame({'id': [3, 4, 5], 'memo': [1, 'a', 2.5], 'hours': ['8', None, '7.5']}))
+    assert writer.close()
+
+    merged = pd.read_parquet(tmp_path / 'merged.parquet')
+    assert len(merged) == 5
+    assert merged['memo'].tolist() == ['a', 'b', '1', 'a', '2.5']
+    assert merged['hours'].tolist()[2:] == ['8', None, '7.5']
+    assert list(tmp_path.iterdir()) == [tmp_path / 'merged.parquet']